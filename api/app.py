@@ -1,17 +1,45 @@
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
+from werkzeug.utils import secure_filename
+from pydantic import BaseModel, Field, ValidationError
+from typing import Literal
 import os
 from datetime import datetime
 import json
-import traceback
 from bson import ObjectId
+import orjson
 import logging
+import logging.handlers
+import queue
+import atexit
 import re  # Added for option formatting in quiz routes
 import tempfile  # ✅ ADD THIS
 import uuid      # ✅ ADD THIS
+import threading
+import hashlib
+import shutil
+import io
+import time
+import functools
+from tasks import JobQueue
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
+# Setup logging - LOG_LEVEL env (INFO by default). Request threads only enqueue
+# records; a background QueueListener does the formatting and stdout writes.
+_log_queue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
+# Message only - the listener's handler adds time/level/name (basicConfig's default would add them twice)
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    handlers=[_log_queue_handler]
+)
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
@@ -25,43 +53,194 @@ CORS(app,
      supports_credentials=True,
      max_age=3600)
 
+# Compress course/quiz JSON (br when the client supports it, else gzip); tiny bodies are sent as-is
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 6
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 1024
+Compress(app)
+
 # ✅ FIXED: Render compatible upload folder
 UPLOAD_FOLDER = tempfile.gettempdir()  # System temp folder use karo
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 60 * 1024 * 1024
+UPLOAD_BUFFER_SIZE = 1 << 20
+
+# Plain-text uploads are decoded directly - OCR is only needed for images/PDFs
+TEXT_MIMETYPES = {'text/plain', 'text/markdown', 'application/json'}
+TEXT_EXTENSIONS = {'.txt', '.md', '.markdown', '.json'}
+
+logger.debug("📁 Upload folder set to: %s", UPLOAD_FOLDER)
+
+class UploadSettings(BaseModel):
+    """Course generation settings from the upload form - parsed and validated in one pass"""
+    difficulty: Literal['beginner', 'intermediate', 'advanced', 'expert'] = 'intermediate'
+    learning_pace: Literal['slow', 'medium', 'fast'] = 'medium'
+    depth_level: Literal['basic', 'intermediate', 'comprehensive', 'expert'] = 'comprehensive'
+    modules: int = Field(4, ge=1, le=20)
+    flashcards: int = Field(10, ge=0, le=50)
+    questions_per_module: int = Field(3, ge=1, le=10)
+    include_practical: bool = True
+    include_case_studies: bool = True
+    include_exam_prep: bool = True
 
-print(f"📁 Upload folder set to: {UPLOAD_FOLDER}")
+class MongoJSONProvider(DefaultJSONProvider):
+    """orjson-backed jsonify()/get_json() with ObjectId support - no pre-conversion pass needed"""
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
 
-class JSONEncoder(json.JSONEncoder):
-    def default(self, obj):
+    @staticmethod
+    def default(obj):
+        # orjson handles datetime natively; only Mongo types need help
         if isinstance(obj, ObjectId):
             return str(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super(JSONEncoder, self).default(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Skip the bytes -> str -> bytes round trip of the default implementation
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+app.json = MongoJSONProvider(app)
+
+# Quiz option normalization (shared by module and course quiz routes)
+_OPT_PREFIX_RE = re.compile(r'^[A-D][\)\.]\s*')
+_LETTERS = ('A', 'B', 'C', 'D')
+_DEFAULT_OPTIONS = (
+    'A) Option A based on module content',
+    'B) Option B based on module content',
+    'C) Option C based on module content',
+    'D) Option D based on module content'
+)
+
+def _validate_options(options):
+    """Return exactly 4 options formatted as 'A) ...', 'B) ...' etc. (shared tuple for the fallback - don't mutate)"""
+    if not isinstance(options, list) or len(options) < 4:
+        return _DEFAULT_OPTIONS
+    
+    formatted_options = []
+    for letter, option in zip(_LETTERS, options):  # Take only first 4 options
+        if isinstance(option, str):
+            stripped = option.strip()
+            if stripped.startswith(f'{letter})'):
+                formatted_options.append(stripped)
+            else:
+                # Clean the option text and add proper formatting
+                formatted_options.append(f"{letter}) {_OPT_PREFIX_RE.sub('', stripped)}")
+        else:
+            formatted_options.append(f"{letter}) {option}")
+    return formatted_options
 
-app.json_encoder = JSONEncoder
+def _normalize_quiz_question(question, question_id, module):
+    """Fill defaults and normalize options/answer for one stored quiz question"""
+    return {
+        'id': question_id,
+        'question': question.get('question', 'Question not available'),
+        'options': _validate_options(question.get('options', [])),
+        'correct_answer': (question.get('correct_answer') or question.get('correctAnswer') or 'A').upper().strip(),
+        'explanation': question.get('explanation', 'Explanation not available'),
+        'difficulty': question.get('difficulty', 'medium'),
+        'knowledgeArea': question.get('knowledgeArea', module.get('title', 'General Knowledge')),
+        'commonMistake': question.get('commonMistake', 'No common mistake information available'),
+        'points': question.get('points', 5)
+    }
 
 # Import your modules
 try:
     from ocr.ultra_ocr_pro_clean import UltraOCREngine
-    from database.mongodb import MongoDBManager
+    from database.mongodb import MongoDBManager, MockMongoDBManager
     from gemini_processor import GeminiCourseGenerator
-    print("✅ All modules imported successfully")
+    logger.info("✅ All modules imported successfully")
 except ImportError as e:
-    print(f"❌ Import error: {e}")
-    traceback.print_exc()
+    logger.exception("❌ Import error: %s", e)
     UltraOCREngine = None
     MongoDBManager = None
+    MockMongoDBManager = None
     GeminiCourseGenerator = None
 
-# Initialize components
-ocr_engine = UltraOCREngine() if UltraOCREngine else None
-db_manager = MongoDBManager() if MongoDBManager else None
-ai_processor = GeminiCourseGenerator() if GeminiCourseGenerator else None
+# Components are created lazily, once per worker process (pymongo clients and
+# thread pools are not fork-safe, so they must never be built before fork)
+_components = {}
+# Re-entrant: the jobs factory calls get_db() while the lock is held
+_components_lock = threading.RLock()
+
+def _get_component(name, factory):
+    if name not in _components:
+        with _components_lock:
+            if name not in _components:
+                _components[name] = factory()
+    return _components[name]
+
+def get_ocr():
+    return _get_component('ocr', lambda: UltraOCREngine() if UltraOCREngine else None)
+
+def _create_db_manager():
+    """Real or mock database, chosen once per process (BRAINFORGE_MOCK=1 for the mock)"""
+    if MongoDBManager is None:
+        return None
+    return MockMongoDBManager() if os.getenv('BRAINFORGE_MOCK') == '1' else MongoDBManager()
+
+def get_db():
+    return _get_component('db', _create_db_manager)
+
+def get_ai():
+    return _get_component('ai', lambda: GeminiCourseGenerator() if GeminiCourseGenerator else None)
+
+def get_jobs():
+    return _get_component('jobs', lambda: JobQueue(db_manager=get_db()))
+
+def init_components():
+    """Eagerly build all components - called from gunicorn post_fork"""
+    get_ocr()
+    get_db()
+    get_ai()
+    get_jobs()
+
+def make_course_cache_key(content, settings):
+    """SHA-256 over whitespace-normalized content + normalized settings
+
+    Re-uploads that differ only in line endings, spacing or OCR blank lines map to the same course.
+    """
+    normalized = " ".join(content.split())
+    return hashlib.sha256(normalized.encode() + json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+def cached_generate_course(content, settings, content_id, on_progress=None):
+    """Generate course, reusing a stored result for identical content + settings"""
+    db_manager = get_db()
+    ai_processor = get_ai()
+    
+    cache_key = make_course_cache_key(content, settings)
+    cached_result = db_manager.get_cached_course(cache_key) if db_manager else None
+    if cached_result:
+        logger.info("⚡ Course cache hit: %s", cache_key[:12])
+        return {**cached_result, "cached": True}
+    
+    course_result = ai_processor.generate_course(
+        content, 
+        settings, 
+        db_manager=db_manager, 
+        content_id=content_id,
+        on_progress=on_progress
+    )
+    
+    # Placeholder or repaired courses (unparseable/truncated model output) must not be served to the next identical upload
+    if course_result.get('success') and not (course_result.get('fallback') or course_result.get('repaired')) and db_manager:
+        db_manager.save_cached_course(cache_key, course_result)
+    
+    return course_result
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
+    ocr_engine = get_ocr()
+    db_manager = get_db()
+    ai_processor = get_ai()
     return jsonify({
         "status": "healthy", 
         "timestamp": datetime.now().isoformat(),
@@ -71,22 +250,25 @@ def health_check():
         "upload_folder": UPLOAD_FOLDER,  # ✅ Show which folder is being used
         "components": {
             "ocr": "ready" if ocr_engine else "error",
-            "database": "ready" if db_manager and db_manager.is_connected() else "error",
+            "database": "ready" if db_manager and db_manager.is_alive() else "error",
             "ai": "ready" if ai_processor else "error"
         }
     })
 
 @app.route('/api/upload', methods=['POST', 'OPTIONS'])
 def upload_file():
-    """Handle file upload and processing with enhanced quiz settings"""
+    """Accept file upload and queue OCR + course generation as a background job"""
+    ocr_engine = get_ocr()
+    db_manager = get_db()
+    job_queue = get_jobs()
     try:
         # Handle preflight OPTIONS request
         if request.method == 'OPTIONS':
             response = jsonify({'status': 'OK'})
             return response
             
-        print("📥 Received upload request")
-        print(f"📁 Upload folder: {UPLOAD_FOLDER}")
+        logger.debug("📥 Received upload request")
+        logger.debug("📁 Upload folder: %s", UPLOAD_FOLDER)
         
         if 'file' not in request.files:
             return jsonify({"error": "No file provided"}), 400
@@ -95,77 +277,135 @@ def upload_file():
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
         
-        print(f"📄 File received: {file.filename}")
+        logger.debug("📄 File received: %s", file.filename)
         
-        # ✅ FIXED: Safe filename with unique ID
-        safe_filename = f"{uuid.uuid4()}_{file.filename}"
+        # ✅ FIXED: Safe filename with unique ID (secure_filename strips path separators)
+        safe_filename = secure_filename(f"{uuid.uuid4().hex}_{file.filename}")
         file_path = os.path.join(UPLOAD_FOLDER, safe_filename)
         
-        print(f"💾 Saving file as: {safe_filename}")
-        print(f"📍 Full path: {file_path}")
+        logger.debug("💾 Saving file as: %s", safe_filename)
+        logger.debug("📍 Full path: %s", file_path)
         
         # Get ENHANCED settings with proper defaults
-        settings = {
-            "difficulty": request.form.get('difficulty', 'intermediate'),
-            "learning_pace": request.form.get('learning_pace', 'medium'),
-            "depth_level": request.form.get('depth_level', 'comprehensive'),
-            "modules": int(request.form.get('modules', 4)),
-            "flashcards": int(request.form.get('flashcards', 10)),
-            "questions_per_module": int(request.form.get('questions_per_module', 3)),
-            "include_practical": request.form.get('include_practical', 'true').lower() == 'true',
-            "include_case_studies": request.form.get('include_case_studies', 'true').lower() == 'true',
-            "include_exam_prep": request.form.get('include_exam_prep', 'true').lower() == 'true'
-        }
+        try:
+            settings = UploadSettings.model_validate(request.form.to_dict()).model_dump()
+        except ValidationError as e:
+            return jsonify({"error": "Invalid settings", "details": e.errors(include_url=False)}), 400
         
-        print(f"⚙️ Settings with quizzes: {settings}")
+        logger.debug("⚙️ Settings with quizzes: %s", settings)
+        
+        if not db_manager:
+            return jsonify({"error": "Database not available"}), 500
+        
+        # Text fast path: decode the stream in place, no temp file and no OCR
+        if _is_text_upload(file):
+            extracted_content = io.TextIOWrapper(file.stream, encoding='utf-8', errors='replace').read()
+            ocr_result = {"text": extracted_content, "source_type": "text", "quality_metrics": {}}
+            logger.debug("📝 Text upload decoded directly: %s characters", len(extracted_content))
+            job_id = job_queue.submit(
+                process_upload_job, None, file.filename, settings, ocr_result,
+                filename=file.filename, settings=settings
+            )
+            logger.info("📬 Text upload queued as job: %s", job_id)
+            return _queued_response(job_id, file.filename)
         
         # ✅ FIXED: Save file with better error handling
+        queued = False
         try:
-            file.save(file_path)
-            print(f"✅ File saved successfully: {file_path}")
-        except Exception as save_error:
-            print(f"❌ File save failed: {save_error}")
-            return jsonify({"error": f"File save failed: {str(save_error)}"}), 500
-        
-        # Check if file actually saved
-        if not os.path.exists(file_path):
-            return jsonify({"error": "File could not be saved to server"}), 500
+            try:
+                # Stream to disk in 1 MB chunks (FileStorage.save copies 16 KB at a time)
+                with open(file_path, 'wb', buffering=UPLOAD_BUFFER_SIZE) as f:
+                    shutil.copyfileobj(file.stream, f, length=UPLOAD_BUFFER_SIZE)
+                logger.debug("✅ File saved successfully: %s", file_path)
+            except Exception as save_error:
+                logger.error("❌ File save failed: %s", save_error)
+                return jsonify({"error": f"File save failed: {str(save_error)}"}), 500
             
-        file_size = os.path.getsize(file_path)
-        print(f"📊 File size: {file_size} bytes")
-        
-        # Process with OCR
-        if not ocr_engine:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({"error": "OCR engine not available"}), 500
+            # Fail fast before queueing if OCR is missing
+            if not ocr_engine:
+                return jsonify({"error": "OCR engine not available"}), 500
+            
+            # Hand off OCR + Gemini generation so this worker is freed immediately
+            job_id = job_queue.submit(
+                process_upload_job, file_path, file.filename, settings,
+                filename=file.filename, settings=settings
+            )
+            queued = True
+            logger.info("📬 Upload queued as job: %s", job_id)
+        finally:
+            # Once queued, the background job owns the file
+            if not queued:
+                _discard_upload(file_path)
+        
+        return _queued_response(job_id, file.filename)
         
-        print("🔍 Starting OCR processing...")
-        ocr_result = ocr_engine.process_file(file_path)
+    except Exception as e:
+        logger.exception("❌ Upload error: %s", e)
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+def _is_text_upload(file):
+    """True for uploads that are already text and can skip OCR"""
+    mimetype = (file.mimetype or '').lower()
+    extension = os.path.splitext(file.filename)[1].lower()
+    return mimetype in TEXT_MIMETYPES or extension in TEXT_EXTENSIONS
+
+def _queued_response(job_id, filename):
+    """202 body pointing the client at the job status endpoint"""
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "filename": filename,
+        "message": "File uploaded, course generation started"
+    }), 202
+
+def _discard_upload(file_path):
+    """Remove a temporary upload; a missing file is fine"""
+    if not file_path:
+        return
+    try:
+        os.unlink(file_path)
+        logger.debug("🧹 Temporary file cleaned up")
+    except FileNotFoundError:
+        pass
+
+def process_upload_job(job_id, file_path, filename, settings, ocr_result=None):
+    """Background pipeline: OCR -> save content -> Gemini course -> save course
+
+    Text uploads arrive with ocr_result already built and no file_path.
+    """
+    ocr_engine = get_ocr()
+    db_manager = get_db()
+    ai_processor = get_ai()
+    job_queue = get_jobs()
+    
+    def fail(error, http_status=500, **extra):
+        logger.error("❌ Job %s failed: %s", job_id, error)
+        job_queue.update(job_id, status="failed", error=error, http_status=http_status, **extra)
+    
+    try:
+        if ocr_result is None:
+            file_size = os.path.getsize(file_path)
+            logger.debug("📊 File size: %s bytes", file_size)
+            
+            # Process with OCR
+            logger.debug("🔍 Starting OCR processing...")
+            job_queue.update(job_id, stage="ocr")
+            ocr_result = ocr_engine.process_file(file_path)
         
         if "error" in ocr_result:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({"error": f"OCR Error: {ocr_result['error']}"}), 500
+            return fail(f"OCR Error: {ocr_result['error']}")
         
         extracted_content = ocr_result.get("text", "")
-        print(f"📝 Extracted content length: {len(extracted_content)} characters")
+        logger.debug("📝 Extracted content length: %s characters", len(extracted_content))
         
         # Validate content
         if len(extracted_content.strip()) < 100:
-            error_msg = f"Only {len(extracted_content.strip())} characters extracted. Please try a different file."
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({"error": error_msg}), 400
-        
-        # Save to database
-        if not db_manager:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({"error": "Database not available"}), 500
+            return fail(f"Only {len(extracted_content.strip())} characters extracted. Please try a different file.", 400)
         
         content_data = {
-            "filename": file.filename,
+            "filename": filename,
             "content": extracted_content,
             "source_type": ocr_result.get("source_type", "unknown"),
             "length": len(extracted_content),
@@ -175,44 +415,35 @@ def upload_file():
         }
         
         content_id = db_manager.save_extracted_content(content_data)
-        print(f"✅ Content saved with ID: {content_id}")
+        if not content_id:
+            return fail("Could not save extracted content")
+        logger.info("✅ Content saved with ID: %s", content_id)
+        job_queue.update(job_id, stage="generating", content_id=content_id)
         
         # Generate course WITH QUIZ SETTINGS
-        print("🤖 Generating course with quiz settings...")
+        logger.debug("🤖 Generating course with quiz settings...")
         if not ai_processor:
-            return jsonify({"error": "AI processor not available"}), 500
+            return fail("AI processor not available")
         
-        course_result = ai_processor.generate_course(
-            extracted_content, 
-            settings, 
-            db_manager=db_manager, 
-            content_id=content_id
+        course_result = cached_generate_course(
+            extracted_content, settings, content_id,
+            on_progress=lambda modules_generated: job_queue.update(job_id, modules_generated=modules_generated)
         )
         
         if not course_result['success']:
             error_msg = course_result.get('error', 'Course generation failed')
-            print(f"❌ Course generation failed: {error_msg}")
-            return jsonify({
-                "success": False,
-                "error": error_msg,
-                "content_id": content_id,
-                "message": "Content extracted but course generation failed"
-            }), 500
+            logger.error("❌ Course generation failed: %s", error_msg)
+            return fail(error_msg, content_id=content_id, message="Content extracted but course generation failed")
         
-        print("✅ Course generated successfully")
+        logger.info("✅ Course generated successfully")
+        job_queue.update(job_id, stage="saving")
         
-        # Handle batched or single course
-        course_id = content_id
         batched = course_result.get('batched', False)
         
         # FIXED: For batched, generator already merged in memory - no need to call merge_partials_to_full()
-        # Just use the complete course_data from generator
+        # A fresh content_id has no stored partials: they are only written when generation is incomplete
         if batched:
-            print("🔗 Batched course merged in memory - no duplicate DB merge")
-            # Clean up partials from DB after successful generation
-            if db_manager and db_manager.partial_courses_collection is not None:
-                delete_result = db_manager.partial_courses_collection.delete_many({"content_id": content_id})
-                print(f"🧹 Cleaned up {delete_result.deleted_count} partials after merge")
+            logger.debug("🔗 Batched course merged in memory - no duplicate DB merge")
         
         # Save full course structure (ONCE, using generator's complete course_data)
         course_data_to_save = {
@@ -226,18 +457,15 @@ def upload_file():
         }
         
         full_course_id = db_manager.save_course_structure(course_data_to_save)
-        print(f"✅ Full course saved with ID: {full_course_id}")
-        
-        # Cleanup
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print("🧹 Temporary file cleaned up")
+        if not full_course_id:
+            return fail("Could not save generated course", content_id=content_id)
+        logger.info("✅ Full course saved with ID: %s", full_course_id)
         
         response_data = {
             "success": True,
             "content_id": content_id,
             "course_id": full_course_id,
-            "filename": file.filename,
+            "filename": filename,
             "content_length": len(extracted_content),
             "course_data": course_result['course_data'],
             "source": course_result.get('source', 'unknown'),
@@ -247,24 +475,37 @@ def upload_file():
             "generation_time": course_result.get('generation_time', 0)
         }
         
-        print("🎉 Upload process completed successfully")
-        return jsonify(response_data)
+        job_queue.update(job_id, status="completed", stage="done", course_id=full_course_id, result=response_data)
+        logger.info("🎉 Upload process completed successfully")
         
-    except Exception as e:
-        print(f"❌ Upload error: {str(e)}")
-        traceback.print_exc()
+    finally:
+        # Cleanup
+        _discard_upload(file_path)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Poll status of a background upload/generation job"""
+    job_queue = get_jobs()
+    try:
+        job = job_queue.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
         
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
-            print("🧹 Temporary file cleaned up after error")
-            
-        return jsonify({"error": f"Server error: {str(e)}"}), 500
+        return jsonify({
+            "success": job.get('status') != 'failed',
+            "job": job
+        })
+        
+    except Exception as e:
+        logger.error("❌ Get job error: %s", e)
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/course/<course_id>', methods=['GET'])
 def get_course(course_id):
     """Get generated course by course ID"""
+    db_manager = get_db()
     try:
-        print(f"📖 Getting course for: {course_id}")
+        logger.debug("📖 Getting course for: %s", course_id)
         
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
@@ -296,11 +537,10 @@ def get_course(course_id):
         if 'modules' not in course_obj:
             course_obj['modules'] = []
         
-        print(f"✅ Course found: {course_data.get('_id', 'Unknown ID')}")
+        logger.debug("✅ Course found: %s", course_data.get('_id', 'Unknown ID'))
         
-        # Convert to JSON serializable format
-        course_data = json.loads(json.dumps(course_data, cls=JSONEncoder))
-        course_data['course_structure'] = course_structure  # Ensure validated structure is set
+        # Shallow copy - course_data may be the shared cached document
+        course_data = {**course_data, 'course_structure': course_structure}  # Ensure validated structure is set
         
         return jsonify({
             "success": True,
@@ -308,40 +548,27 @@ def get_course(course_id):
         })
         
     except Exception as e:
-        print(f"❌ Get course error: {str(e)}")
+        logger.error("❌ Get course error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/course/<course_id>/module/<module_number>/quiz', methods=['GET'])
 def get_module_quiz(course_id, module_number):
     """Get quiz for specific module with proper validation"""
+    db_manager = get_db()
     try:
-        print(f"🎯 Getting quiz for course: {course_id}, module: {module_number}")
+        logger.debug("🎯 Getting quiz for course: %s, module: %s", course_id, module_number)
         
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
             
-        course_data = db_manager.get_course_by_id(course_id)
+        # FIXED: Handles both course_structure.course.modules and direct course_structure.modules
+        course_data, modules, modules_by_num = db_manager.get_quiz_modules(course_id)
         if not course_data:
             return jsonify({"error": "Course not found"}), 404
         
         module_num = int(module_number)
-        module = None
-        
-        # FIXED: Handle both course_structure.course.modules and direct course_structure.modules
+        module = modules_by_num.get(module_num)
         course_structure = course_data.get('course_structure', {})
-        if isinstance(course_structure, dict) and 'course' in course_structure:
-            modules = course_structure['course'].get('modules', [])
-        else:
-            modules = course_structure.get('modules', []) if isinstance(course_structure, dict) else []
-        
-        # Ensure modules is array
-        if not isinstance(modules, list):
-            modules = []
-        
-        for mod in modules:
-            if mod.get('module_number') == module_num:
-                module = mod
-                break
         
         if not module:
             return jsonify({
@@ -361,51 +588,10 @@ def get_module_quiz(course_id, module_number):
             }), 404
         
         # Validate and fix quiz questions
-        validated_questions = []
-        for i, question in enumerate(quiz_data.get('questions', [])):
-            # Ensure options are properly formatted
-            options = question.get('options', [])
-            if not isinstance(options, list) or len(options) < 4:
-                options = [
-                    'A) Option A based on module content',
-                    'B) Option B based on module content',
-                    'C) Option C based on module content',
-                    'D) Option D based on module content'
-                ]
-            else:
-                # Ensure each option has proper formatting
-                formatted_options = []
-                for j, option in enumerate(options[:4]):  # Take only first 4 options
-                    if isinstance(option, str):
-                        option_letter = ['A', 'B', 'C', 'D'][j]
-                        if not option.strip().startswith(f'{option_letter})'):
-                            # Clean the option text and add proper formatting
-                            clean_option = re.sub(r'^[A-D][\)\.]\s*', '', option.strip())
-                            formatted_options.append(f"{option_letter}) {clean_option}")
-                        else:
-                            formatted_options.append(option.strip())
-                    else:
-                        option_letter = ['A', 'B', 'C', 'D'][j]
-                        formatted_options.append(f"{option_letter}) {str(option)}")
-                options = formatted_options
-            
-            # Ensure we have exactly 4 options
-            while len(options) < 4:
-                option_letter = ['A', 'B', 'C', 'D'][len(options)]
-                options.append(f"{option_letter}) Option based on module content")
-            
-            validated_question = {
-                'id': question.get('id', i + 1),
-                'question': question.get('question', 'Question not available'),
-                'options': options,
-                'correct_answer': (question.get('correct_answer') or question.get('correctAnswer') or 'A').upper().strip(),
-                'explanation': question.get('explanation', 'Explanation not available'),
-                'difficulty': question.get('difficulty', 'medium'),
-                'knowledgeArea': question.get('knowledgeArea', module.get('title', 'General Knowledge')),
-                'commonMistake': question.get('commonMistake', 'No common mistake information available'),
-                'points': question.get('points', 5)
-            }
-            validated_questions.append(validated_question)
+        validated_questions = [
+            _normalize_quiz_question(question, question.get('id', i + 1), module)
+            for i, question in enumerate(quiz_data.get('questions', []))
+        ]
         
         validated_quiz = {
             'questions': validated_questions,
@@ -414,7 +600,7 @@ def get_module_quiz(course_id, module_number):
             'moduleTitle': f"{module.get('title', 'Module')} Quiz"
         }
         
-        print(f"✅ Found {len(validated_questions)} validated quiz questions")
+        logger.debug("✅ Found %s validated quiz questions", len(validated_questions))
         
         return jsonify({
             "success": True,
@@ -425,84 +611,31 @@ def get_module_quiz(course_id, module_number):
         })
         
     except Exception as e:
-        print(f"❌ Get quiz error: {str(e)}")
-        traceback.print_exc()
+        logger.exception("❌ Get quiz error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/course/<course_id>/quiz', methods=['GET'])
 def get_course_quiz(course_id):
     """Get comprehensive quiz for entire course"""
+    db_manager = get_db()
     try:
-        print(f"🎯 Getting comprehensive quiz for course: {course_id}")
+        logger.debug("🎯 Getting comprehensive quiz for course: %s", course_id)
         
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
             
-        course_data = db_manager.get_course_by_id(course_id)
-        if not course_data:
+        # Questions arrive already flattened across modules by a Mongo aggregation
+        course_title, questions = db_manager.get_course_quiz_questions(course_id)
+        if questions is None:
             return jsonify({"error": "Course not found"}), 404
         
         all_questions = []
-        course_structure = course_data.get('course_structure', {})
-        
-        # FIXED: Handle structure safely
-        if isinstance(course_structure, dict) and 'course' in course_structure:
-            modules = course_structure['course'].get('modules', [])
-        else:
-            modules = course_structure.get('modules', []) if isinstance(course_structure, dict) else []
-        
-        # Ensure modules is list
-        if not isinstance(modules, list):
-            modules = []
-        
-        for module in modules:
-            quiz_data = module.get('quiz', {})
-            questions = quiz_data.get('questions', [])
-            
-            for i, question in enumerate(questions):
-                # Validate and format options
-                options = question.get('options', [])
-                if not isinstance(options, list) or len(options) < 4:
-                    options = [
-                        'A) Option A based on module content',
-                        'B) Option B based on module content',
-                        'C) Option C based on module content',
-                        'D) Option D based on module content'
-                    ]
-                else:
-                    formatted_options = []
-                    for j, option in enumerate(options[:4]):
-                        if isinstance(option, str):
-                            option_letter = ['A', 'B', 'C', 'D'][j]
-                            if not option.strip().startswith(f'{option_letter})'):
-                                clean_option = re.sub(r'^[A-D][\)\.]\s*', '', option.strip())
-                                formatted_options.append(f"{option_letter}) {clean_option}")
-                            else:
-                                formatted_options.append(option.strip())
-                        else:
-                            option_letter = ['A', 'B', 'C', 'D'][j]
-                            formatted_options.append(f"{option_letter}) {str(option)}")
-                    options = formatted_options
-                
-                # Ensure 4 options
-                while len(options) < 4:
-                    option_letter = ['A', 'B', 'C', 'D'][len(options)]
-                    options.append(f"{option_letter}) Option based on course content")
-                
-                validated_question = {
-                    'id': len(all_questions) + 1,
-                    'question': question.get('question', 'Question not available'),
-                    'options': options,
-                    'correct_answer': (question.get('correct_answer') or question.get('correctAnswer') or 'A').upper().strip(),
-                    'explanation': question.get('explanation', 'Explanation not available'),
-                    'difficulty': question.get('difficulty', 'medium'),
-                    'knowledgeArea': question.get('knowledgeArea', module.get('title', 'General Knowledge')),
-                    'commonMistake': question.get('commonMistake', 'No common mistake information available'),
-                    'points': question.get('points', 5),
-                    'module': module.get('module_number'),
-                    'module_title': module.get('title', 'Unknown Module')
-                }
-                all_questions.append(validated_question)
+        for row in questions:
+            module = row.get('module', {})
+            validated_question = _normalize_quiz_question(row['question'], len(all_questions) + 1, module)
+            validated_question['module'] = module.get('module_number')
+            validated_question['module_title'] = module.get('title', 'Unknown Module')
+            all_questions.append(validated_question)
         
         if not all_questions:
             return jsonify({
@@ -517,27 +650,27 @@ def get_course_quiz(course_id):
             'moduleTitle': 'Course Comprehensive Assessment'
         }
         
-        print(f"✅ Found {len(all_questions)} questions for comprehensive quiz")
+        logger.debug("✅ Found %s questions for comprehensive quiz", len(all_questions))
         
         return jsonify({
             "success": True,
             "quiz": comprehensive_quiz,
-            "course_title": course_structure.get('course', {}).get('title', 'Unknown Course') if isinstance(course_structure, dict) else 'Unknown Course'
+            "course_title": course_title or 'Unknown Course'
         })
         
     except Exception as e:
-        print(f"❌ Get comprehensive quiz error: {str(e)}")
+        logger.error("❌ Get comprehensive quiz error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/recent-courses', methods=['GET'])
 def get_recent_courses():
     """Get recently generated courses"""
+    db_manager = get_db()
     try:
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
             
         courses = db_manager.get_recent_courses(limit=10)
-        courses = json.loads(json.dumps(courses, cls=JSONEncoder))
         
         return jsonify({
             "success": True,
@@ -549,6 +682,7 @@ def get_recent_courses():
 @app.route('/api/debug/db', methods=['GET'])
 def debug_database():
     """Debug database information"""
+    db_manager = get_db()
     try:
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
@@ -564,6 +698,7 @@ def debug_database():
 @app.route('/api/analytics/quiz-result', methods=['POST'])
 def save_quiz_result():
     """Save quiz results"""
+    db_manager = get_db()
     try:
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
@@ -597,6 +732,8 @@ def save_quiz_result():
 @app.route('/api/generate-course', methods=['POST'])
 def generate_course():
     """Generate course from extracted content with settings - Supports batching"""
+    db_manager = get_db()
+    ai_processor = get_ai()
     try:
         data = request.get_json()
         if not data:
@@ -605,8 +742,8 @@ def generate_course():
         content_id = data.get('content_id')
         settings = data.get('settings', {})
         
-        print(f"🔄 Generate course request for content_id: {content_id}")
-        print(f"⚙️ Settings provided: {settings}")
+        logger.debug("🔄 Generate course request for content_id: %s", content_id)
+        logger.debug("⚙️ Settings provided: %s", settings)
         
         if not content_id:
             return jsonify({"error": "Content ID required"}), 400
@@ -619,19 +756,14 @@ def generate_course():
         if not content_data:
             return jsonify({"error": "Content not found"}), 404
         
-        print(f"📝 Found content: {len(content_data['content'])} characters")
+        logger.debug("📝 Found content: %s characters", len(content_data['content']))
         
         # Generate course WITH SETTINGS AND BATCHING
-        print("🤖 Generating course with settings...")
+        logger.debug("🤖 Generating course with settings...")
         if not ai_processor:
             return jsonify({"error": "AI processor not available"}), 500
         
-        course_result = ai_processor.generate_course(
-            content_data['content'], 
-            settings, 
-            db_manager=db_manager, 
-            content_id=content_id
-        )
+        course_result = cached_generate_course(content_data['content'], settings, content_id)
         
         if not course_result['success']:
             return jsonify({"error": course_result.get('error', 'Course generation failed')}), 500
@@ -641,11 +773,11 @@ def generate_course():
         course_id = content_id
         
         if batched:
-            print("🔗 Batched course merged in memory - no duplicate DB merge")
-            # Clean up partials
-            if db_manager and db_manager.partial_courses_collection is not None:
-                delete_result = db_manager.partial_courses_collection.delete_many({"content_id": content_id})
-                print(f"🧹 Cleaned up {delete_result.deleted_count} partials")
+            logger.debug("🔗 Batched course merged in memory - no duplicate DB merge")
+            # Clean up partials left by an earlier incomplete generation of this content
+            if db_manager:
+                db_manager.delete_partials(content_id)
+                logger.debug("🧹 Partials cleanup sent")
         
         # Save full course (ONCE)
         course_data_to_save = {
@@ -659,6 +791,8 @@ def generate_course():
         }
         
         full_course_id = db_manager.save_course_structure(course_data_to_save)
+        if not full_course_id:
+            return jsonify({"error": "Could not save generated course", "content_id": content_id}), 500
         
         return jsonify({
             "success": True,
@@ -674,37 +808,58 @@ def generate_course():
         })
         
     except Exception as e:
-        print(f"❌ Course generation error: {str(e)}")
-        traceback.print_exc()
+        logger.exception("❌ Course generation error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/merge-partial-course/<content_id>', methods=['POST'])
 def merge_partial_course(content_id):
-    """Manually merge partial courses for a content_id"""
+    """Manually merge partial courses for a content_id (runs as a background job)"""
+    db_manager = get_db()
+    job_queue = get_jobs()
     try:
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
-            
-        merged = db_manager.merge_partials_to_full(content_id)
-        if not merged:
-            return jsonify({"error": "No partials to merge or merge failed"}), 400
         
-        print(f"✅ Manual merge for {content_id}: {merged.get('_id')}")
+        job_id = job_queue.submit(merge_partials_job, content_id, content_id=content_id)
+        logger.info("📬 Merge for %s queued as job: %s", content_id, job_id)
         return jsonify({
             "success": True,
-            "course_id": str(merged.get('_id')),
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/api/jobs/{job_id}",
             "content_id": content_id,
-            "message": "Partials merged successfully"
-        })
+            "message": "Partial merge started"
+        }), 202
     except Exception as e:
-        print(f"❌ Merge error: {str(e)}")
+        logger.error("❌ Merge error: %s", e)
         return jsonify({"error": str(e)}), 500
 
+def merge_partials_job(job_id, content_id):
+    """Background job: merge partials server-side and record the new course id"""
+    db_manager = get_db()
+    job_queue = get_jobs()
+    
+    job_queue.update(job_id, stage="merging")
+    merged = db_manager.merge_partials_to_full(content_id)
+    if not merged:
+        job_queue.update(job_id, status="failed", error="No partials to merge or merge failed", http_status=400)
+        return
+    
+    course_id = str(merged.get('_id'))
+    logger.info("✅ Manual merge for %s: %s", content_id, course_id)
+    job_queue.update(job_id, status="completed", stage="done", course_id=course_id, result={
+        "success": True,
+        "course_id": course_id,
+        "content_id": content_id,
+        "message": "Partials merged successfully"
+    })
+
 @app.route('/api/content/<content_id>', methods=['GET'])
 def get_content(content_id):
     """Get extracted content by ID"""
+    db_manager = get_db()
     try:
-        print(f"📄 Getting content for: {content_id}")
+        logger.debug("📄 Getting content for: %s", content_id)
         
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
@@ -713,16 +868,13 @@ def get_content(content_id):
         if not content_data:
             return jsonify({"error": "Content not found"}), 404
         
-        # Convert to JSON serializable format
-        content_data = json.loads(json.dumps(content_data, cls=JSONEncoder))
-        
         return jsonify({
             "success": True,
             "content": content_data
         })
         
     except Exception as e:
-        print(f"❌ Get content error: {str(e)}")
+        logger.error("❌ Get content error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/course-settings/options', methods=['GET'])
@@ -759,15 +911,25 @@ def get_course_settings_options():
         "batching_note": "For >4 modules, generation uses batching to avoid timeouts (faster & reliable)"
     })
 
+@functools.lru_cache(maxsize=1)
+def _count_upload_files(time_bucket):
+    """Count entries in UPLOAD_FOLDER without building a name list; cached per time_bucket"""
+    try:
+        with os.scandir(UPLOAD_FOLDER) as entries:
+            return sum(1 for _ in entries)
+    except FileNotFoundError:
+        return 0
+
 @app.route('/api/debug', methods=['GET'])
 def debug_info():
     """Debug information (enhanced)"""
+    db_manager = get_db()
     return jsonify({
         "status": "running",
         "timestamp": datetime.now().isoformat(),
         "upload_folder": UPLOAD_FOLDER,
-        "files_in_upload": len(os.listdir(UPLOAD_FOLDER)) if os.path.exists(UPLOAD_FOLDER) else 0,
-        "database_connected": db_manager.is_connected() if db_manager else False,
+        "files_in_upload": _count_upload_files(int(time.time() // 5)),  # Refreshed at most every 5s
+        "database_connected": db_manager.is_alive() if db_manager else False,
         "batching_supported": True,
         "timeout_limit": "300s"
     })
@@ -776,19 +938,20 @@ def debug_info():
 def test_upload():
     """Test upload endpoint"""
     try:
-        print("🧪 Test upload endpoint called")
+        logger.debug("🧪 Test upload endpoint called")
         return jsonify({
             "success": True,
             "message": "Upload endpoint is working",
             "timestamp": datetime.now().isoformat()
         })
     except Exception as e:
-        print(f"❌ Test upload error: {e}")
+        logger.error("❌ Test upload error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/analytics/progress', methods=['POST'])
 def save_progress_analytics():
     """Save learning progress analytics"""
+    db_manager = get_db()
     try:
         if not db_manager:
             return jsonify({"error": "Database not available"}), 500
@@ -806,8 +969,9 @@ def save_progress_analytics():
             'completed_at': datetime.now()
         }
         
+        # Buffered and bulk-written by the DB layer - nothing waits on Mongo here
         success = db_manager.save_learning_analytics(analytics_data)
-        return jsonify({"success": success})
+        return jsonify({"success": success, "queued": success}), 202 if success else 500
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -832,10 +996,10 @@ def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 if __name__ == '__main__':
-    print("🚀 Starting BrainForge Backend with Enhanced CORS Support...")
-    print("🔧 Debug mode: ON | CORS: Enabled")
-    print(f"📁 Upload Folder: {UPLOAD_FOLDER}")  # ✅ Show which folder is being used
-    print("🌐 Allowed Origins: ALL (*) - Complete CORS access")
-    print("💡 Server running on http://localhost:5000")
+    # Local development only - production runs `gunicorn wsgi:app -c gunicorn.conf.py` (gevent workers)
+    debug = os.getenv('FLASK_DEBUG', '0') == '1'
+    port = int(os.getenv('PORT', 5000))
+    logger.info("🚀 Starting BrainForge dev server on http://localhost:%s (debug=%s)", port, debug)
+    logger.info("📁 Upload Folder: %s", UPLOAD_FOLDER)
     
-    app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
+    app.run(debug=debug, port=port, host='0.0.0.0', threaded=True)
@@ -1,39 +1,165 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, DeleteMany
+from pymongo.write_concern import WriteConcern
+from pymongo.errors import BulkWriteError
 from datetime import datetime
 import os
 from dotenv import load_dotenv
-import json
 from bson import ObjectId
-from bson.json_util import dumps
+from cachetools import TTLCache
+import threading
+import time
+import atexit
+import logging
+import weakref
 
-load_dotenv()
+if os.getenv('VERCEL') != '1':  # No .env on Vercel - skip the directory walk
+    load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Every manager with an analytics buffer - flushed by one exit hook instead of one per instance
+_analytics_managers = weakref.WeakSet()
+
+@atexit.register
+def _flush_all_analytics():
+    for manager in list(_analytics_managers):
+        manager.flush_analytics()
+
+# Mock-mode documents, built once at import
+_MOCK_COURSE_TEMPLATE = {
+    "_id": "mock_course_id_123",
+    "course_structure": {
+        "course": {
+            "title": "Data Communications & Networking",
+            "description": "Comprehensive course on networking fundamentals",
+            "total_modules": 4,
+            "difficulty": "intermediate",
+            "learning_pace": "medium",
+            "depth_level": "comprehensive",
+            "estimated_duration": "3 hours",
+            "include_practical": True,
+            "include_case_studies": True,
+            "include_exam_prep": True,
+            "modules": [
+                {
+                    "module_number": 1,
+                    "title": "Introduction to Networking",
+                    "learning_objectives": ["Understand basic concepts", "Learn protocols"],
+                    "content": {
+                        "introduction": "Networking basics",
+                        "sections": [{"heading": "Concepts", "content": "Basic networking concepts"}],
+                        "conclusion": "Summary"
+                    },
+                    "quiz": {
+                        "questions": [
+                            {
+                                "question": "What is a network?",
+                                "options": ["A) Connected devices", "B) Single computer", "C) Software", "D) None"],
+                                "correct_answer": "A",
+                                "explanation": "Network means connected devices"
+                            }
+                        ]
+                    },
+                    "practical_exercises": [
+                        {
+                            "title": "Network Setup Simulation",
+                            "description": "Set up a basic network topology",
+                            "steps": ["Step 1: Identify devices", "Step 2: Connect cables", "Step 3: Configure IP addresses"],
+                            "expected_outcome": "Working network connection"
+                        }
+                    ],
+                    "important_topics": ["OSI Model", "TCP/IP", "Network Topologies"],
+                    "exam_questions": [
+                        {
+                            "question": "Explain the OSI model layers",
+                            "type": "descriptive",
+                            "marks": 10,
+                            "importance": "high"
+                        }
+                    ]
+                }
+            ],
+            "flashcards": [
+                {"front": "LAN", "back": "Local Area Network", "mnemonic": "Small network"}
+            ]
+        }
+    }
+}
+
+_MOCK_RECENT_COURSE = {
+    "total_modules": 4,
+    "difficulty": "intermediate",
+    "learning_pace": "medium",
+    "depth_level": "comprehensive",
+    "estimated_duration": "2 hours",
+    "modules_count": 4,
+    "flashcards_count": 8,
+    "has_practical": True,
+    "has_case_studies": True,
+    "has_exam_prep": True
+}
 
 class MongoDBManager:
-    def __init__(self):
+    def __init__(self, bootstrap_indexes=None):
+        # Per-process cache for hot, idempotent reads (course/content/quiz GETs)
+        self._read_cache = TTLCache(
+            maxsize=int(os.getenv('READ_CACHE_SIZE', 512)),
+            ttl=int(os.getenv('READ_CACHE_TTL', 60))
+        )
+        self._read_cache_lock = threading.Lock()
+        
+        # Cached server liveness for health checks
+        self._last_ping_ts = 0.0
+        self._last_ping_ok = False
+        
+        # Analytics events are buffered and written with one insert_many per flush
+        self._analytics_buffer = []
+        self._analytics_lock = threading.Lock()
+        self._analytics_flush_armed = False
+        self._analytics_flush_size = int(os.getenv('ANALYTICS_FLUSH_SIZE', 50))
+        self._analytics_flush_interval = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 5))
+        self._analytics_max_buffer = int(os.getenv('ANALYTICS_MAX_BUFFER', 1000))
+        _analytics_managers.add(self)
+        
         try:
             mongodb_uri = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
-            self.client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
+            self.client = MongoClient(
+                mongodb_uri,
+                maxPoolSize=int(os.getenv('MONGO_POOL', 200)),
+                minPoolSize=int(os.getenv('MONGO_MIN_POOL', 10)),
+                compressors=os.getenv('MONGO_COMPRESSORS', 'zstd,zlib'),  # Course documents compress well
+                retryWrites=True,
+                serverSelectionTimeoutMS=5000,
+                socketTimeoutMS=30000
+            )
             self.db = self.client['brainforge_db']
             self.content_collection = self.db['extracted_content']
             self.courses_collection = self.db['generated_courses']
             self.user_sessions_collection = self.db['user_sessions']
             self.analytics_collection = self.db['learning_analytics']
             self.partial_courses_collection = self.db['partial_courses']  # New for batching support
+            # Fire-and-forget handle for partial cleanup (w=0: no server acknowledgement wait)
+            self.partial_courses_unacked = self.partial_courses_collection.with_options(write_concern=WriteConcern(w=0))
+            self.jobs_collection = self.db['processing_jobs']  # Background upload/generation jobs
+            self.course_cache_collection = self.db['course_cache']  # Content-addressed Gemini results
             
             # Test connection
             self.client.admin.command('ismaster')
             
-            # Create indexes for better performance
-            self.content_collection.create_index("filename")
-            self.courses_collection.create_index("content_id")
-            self.partial_courses_collection.create_index("content_id")
-            self.partial_courses_collection.create_index("batch_num")
-            self.user_sessions_collection.create_index("course_id")
-            self.analytics_collection.create_index("course_id")
+            # Index DDL runs once per deploy (gunicorn on_starting / --init-indexes), not per worker
+            if bootstrap_indexes is None:
+                bootstrap_indexes = os.getenv('BRAINFORGE_BOOTSTRAP_INDEXES', '1') != '0'
+            if bootstrap_indexes:
+                # A failed build (e.g. duplicate (content_id, batch_num) partials left by older
+                # per-batch inserts blocking the unique index) must not take the connection down
+                try:
+                    self.ensure_indexes()
+                except Exception as e:
+                    logger.error("❌ MongoDB index setup failed, continuing without it: %s", e)
             
-            print("✅ MongoDB connected successfully")
+            logger.info("✅ MongoDB connected successfully")
         except Exception as e:
-            print(f"❌ MongoDB connection error: {e}")
+            logger.error("❌ MongoDB connection error: %s", e)
             self.client = None
             self.db = None
             self.content_collection = None
@@ -41,125 +167,317 @@ class MongoDBManager:
             self.user_sessions_collection = None
             self.analytics_collection = None
             self.partial_courses_collection = None
+            self.partial_courses_unacked = None
+            self.jobs_collection = None
+            self.course_cache_collection = None
+    
+    def ensure_indexes(self):
+        """Create (idempotently) every index the queries rely on"""
+        self.content_collection.create_index("filename")
+        self.courses_collection.create_index("content_id")
+        self.courses_collection.create_index([("created_at", -1)])  # Recent courses / stats
+        # Partial lookup and ordered merge by content_id are served by one index
+        self.partial_courses_collection.create_index([("content_id", 1), ("batch_num", 1)], unique=True)
+        # Orphans from crashed/abandoned generations expire on their own
+        self.partial_courses_collection.create_index(
+            "created_at",
+            expireAfterSeconds=int(os.getenv('PARTIAL_COURSE_TTL', 24 * 3600))
+        )
+        # Progress upserts/sorted reads and quiz-result history by course
+        self.user_sessions_collection.create_index([("course_id", 1), ("module_number", 1)])
+        self.user_sessions_collection.create_index([("course_id", 1), ("completed_at", -1)])
+        # Single-field indexes now covered by the compound prefixes above
+        self._drop_index_if_exists(self.partial_courses_collection, "content_id_1", "batch_num_1")
+        self._drop_index_if_exists(self.user_sessions_collection, "course_id_1")
+        self.analytics_collection.create_index("course_id")
+        self.jobs_collection.create_index("job_id", unique=True)
+        self.jobs_collection.create_index(
+            "created_at",
+            expireAfterSeconds=int(os.getenv('JOB_TTL', 24 * 3600))
+        )
+        self.course_cache_collection.create_index("cache_key", unique=True)
+        self.course_cache_collection.create_index(
+            "created_at",
+            expireAfterSeconds=int(os.getenv('COURSE_CACHE_TTL', 7 * 24 * 3600))
+        )
+        
+        logger.info("✅ MongoDB indexes ensured")
+    
+    @staticmethod
+    def _drop_index_if_exists(collection, *names):
+        """Drop leftover indexes by name; ones that were never created are skipped"""
+        existing = set(collection.index_information())
+        for name in names:
+            if name in existing:
+                collection.drop_index(name)
     
     def is_connected(self):
         """Check if MongoDB is connected"""
         return self.client is not None and self.db is not None
     
+    def is_alive(self, max_age=5):
+        """Ping the server at most once every max_age seconds and return the cached result"""
+        if not self.is_connected():
+            return False
+        
+        now = time.monotonic()
+        if now - self._last_ping_ts > max_age:
+            try:
+                self.client.admin.command('ping', maxTimeMS=500)
+                self._last_ping_ok = True
+            except Exception as e:
+                logger.warning("⚠️ MongoDB ping failed: %s", e)
+                self._last_ping_ok = False
+            self._last_ping_ts = now
+        return self._last_ping_ok
+    
+    def _cache_get(self, key):
+        with self._read_cache_lock:
+            return self._read_cache.get(key)
+    
+    def _cache_set(self, key, value):
+        with self._read_cache_lock:
+            self._read_cache[key] = value
+    
+    def invalidate_cache(self, *keys):
+        """Drop cached reads, e.g. invalidate_cache(('course', course_id))"""
+        with self._read_cache_lock:
+            for key in keys:
+                self._read_cache.pop(key, None)
+    
+    def invalidate_cache_kind(self, *kinds):
+        """Drop every cached read whose key starts with one of kinds, e.g. invalidate_cache_kind('recent')"""
+        with self._read_cache_lock:
+            for key in [k for k in self._read_cache.keys() if k[0] in kinds]:
+                self._read_cache.pop(key, None)
+    
     def save_extracted_content(self, content_data):
         """Save extracted content to database"""
         if not self.is_connected() or self.content_collection is None:
-            print("⚠️ MongoDB not connected, using mock ID")
-            return "mock_content_id_123"
+            logger.warning("⚠️ MongoDB not connected, content not saved")
+            return None
         
         try:
-            content_data['created_at'] = datetime.now()
-            content_data['updated_at'] = datetime.now()
+            content_data['created_at'] = content_data['updated_at'] = datetime.now()
             result = self.content_collection.insert_one(content_data)
-            print(f"✅ Content saved with ID: {result.inserted_id}")
+            logger.debug("✅ Content saved with ID: %s", result.inserted_id)
             return str(result.inserted_id)
         except Exception as e:
-            print(f"❌ Error saving content: {e}")
-            return f"mock_content_id_{datetime.now().timestamp()}"
+            logger.error("❌ Error saving content: %s", e)
+            return None
     
     def get_content_by_id(self, content_id):
         """Get content by ID"""
         if not self.is_connected() or self.content_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return None
         
         try:
-            # Handle both string and ObjectId
-            if isinstance(content_id, str) and content_id.startswith('mock_'):
-                return {
-                    "_id": content_id,
-                    "filename": "mock_file.pdf",
-                    "content": "Mock content for testing",
-                    "source_type": "pdf",
-                    "length": 100,
-                    "created_at": datetime.now()
-                }
+            cached = self._cache_get(('content', content_id))
+            if cached is not None:
+                return cached
             
             content = self.content_collection.find_one({"_id": ObjectId(content_id)})
             if content:
                 content['_id'] = str(content['_id'])  # Convert ObjectId to string
+                self._cache_set(('content', content_id), content)
             return content
         except Exception as e:
-            print(f"❌ Error getting content: {e}")
+            logger.error("❌ Error getting content: %s", e)
             return None
     
     def save_course_structure(self, course_data):
         """Save course structure to database"""
         if not self.is_connected() or self.courses_collection is None:
-            print("⚠️ MongoDB not connected, using mock ID")
-            return "mock_course_id_123"
+            logger.warning("⚠️ MongoDB not connected, course not saved")
+            return None
         
         try:
-            course_data['created_at'] = datetime.now()
-            course_data['updated_at'] = datetime.now()
+            course_data['created_at'] = course_data['updated_at'] = datetime.now()
             result = self.courses_collection.insert_one(course_data)
-            print(f"✅ Course saved with ID: {result.inserted_id}")
+            self.invalidate_cache(('course_by_content', course_data.get('content_id')))
+            self.invalidate_cache_kind('recent', 'stats')
+            logger.debug("✅ Course saved with ID: %s", result.inserted_id)
             return str(result.inserted_id)
         except Exception as e:
-            print(f"❌ Error saving course: {e}")
-            return f"mock_course_id_{datetime.now().timestamp()}"
+            logger.error("❌ Error saving course: %s", e)
+            return None
     
     def get_course_by_content_id(self, content_id):
         """Get course by content ID"""
         if not self.is_connected() or self.courses_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return None
         
         try:
-            # Handle mock IDs
-            if isinstance(content_id, str) and content_id.startswith('mock_'):
-                return self._create_mock_course(content_id)
+            cached = self._cache_get(('course_by_content', content_id))
+            if cached is not None:
+                return cached
             
             course = self.courses_collection.find_one({"content_id": content_id})
             if course:
                 course['_id'] = str(course['_id'])  # Convert ObjectId to string
+                self._cache_set(('course_by_content', content_id), course)
             return course
         except Exception as e:
-            print(f"❌ Error getting course: {e}")
+            logger.error("❌ Error getting course: %s", e)
             return None
     
     def get_course_by_id(self, course_id):
         """Get course by course ID"""
         if not self.is_connected() or self.courses_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return None
         
         try:
-            if isinstance(course_id, str) and course_id.startswith('mock_'):
-                return self._create_mock_course(course_id)
+            cached = self._cache_get(('course', course_id))
+            if cached is not None:
+                return cached
             
             course = self.courses_collection.find_one({"_id": ObjectId(course_id)})
             if course:
                 course['_id'] = str(course['_id'])
+                self._cache_set(('course', course_id), course)
             return course
         except Exception as e:
-            print(f"❌ Error getting course by ID: {e}")
+            logger.error("❌ Error getting course by ID: %s", e)
             return None
     
+    def get_course_quiz_only(self, course_id):
+        """Get only the fields quiz routes need (course title, module number/title/quiz)"""
+        if not self.is_connected() or self.courses_collection is None:
+            logger.warning("⚠️ MongoDB not connected")
+            return None
+        
+        try:
+            projection = {}
+            # Support both course_structure.course.modules and direct course_structure.modules
+            for prefix in ('course_structure.course', 'course_structure'):
+                projection[f'{prefix}.title'] = 1
+                projection[f'{prefix}.modules.module_number'] = 1
+                projection[f'{prefix}.modules.title'] = 1
+                projection[f'{prefix}.modules.quiz'] = 1
+            
+            cached = self._cache_get(('quiz', course_id))
+            if cached is not None:
+                return cached
+            
+            course = self.courses_collection.find_one({"_id": ObjectId(course_id)}, projection)
+            if course:
+                course['_id'] = str(course['_id'])
+                self._cache_set(('quiz', course_id), course)
+            return course
+        except Exception as e:
+            logger.error("❌ Error getting course quiz: %s", e)
+            return None
+    
+    def get_quiz_modules(self, course_id):
+        """Quiz-only course plus its modules list and a cached module_number -> module index"""
+        course = self.get_course_quiz_only(course_id)
+        if not course:
+            return None, [], {}
+        
+        # Handle both course_structure.course.modules and direct course_structure.modules
+        course_structure = course.get('course_structure', {})
+        if isinstance(course_structure, dict) and 'course' in course_structure:
+            modules = course_structure['course'].get('modules', [])
+        else:
+            modules = course_structure.get('modules', []) if isinstance(course_structure, dict) else []
+        
+        if not isinstance(modules, list):
+            modules = []
+        
+        modules_by_num = self._cache_get(('modules_by_num', course_id))
+        if modules_by_num is None:
+            modules_by_num = {}
+            for module in modules:
+                modules_by_num.setdefault(module.get('module_number'), module)  # First match wins
+            self._cache_set(('modules_by_num', course_id), modules_by_num)
+        
+        return course, modules, modules_by_num
+    
+    def get_course_quiz_questions(self, course_id):
+        """Every quiz question in a course, flattened server-side with their module number/title
+
+        Returns (course_title, [{'question': {...}, 'module': {'module_number', 'title'}}, ...]) or
+        (None, None) if the course does not exist.
+        """
+        if not self.is_connected() or self.courses_collection is None:
+            logger.warning("⚠️ MongoDB not connected")
+            return None, None
+        
+        try:
+            cached = self._cache_get(('quiz_questions', course_id))
+            if cached is not None:
+                return cached
+            
+            # Support both course_structure.course.modules and direct course_structure.modules;
+            # preserveNullAndEmptyArrays keeps a row for courses without questions so "not found" stays distinct
+            rows = list(self.courses_collection.aggregate([
+                {'$match': {'_id': ObjectId(course_id)}},
+                {'$project': {
+                    '_id': 0,
+                    'title': '$course_structure.course.title',
+                    'modules': {'$ifNull': ['$course_structure.course.modules', '$course_structure.modules']}
+                }},
+                {'$unwind': {'path': '$modules', 'preserveNullAndEmptyArrays': True}},
+                {'$unwind': {'path': '$modules.quiz.questions', 'preserveNullAndEmptyArrays': True}},
+                {'$project': {
+                    'title': 1,
+                    'question': '$modules.quiz.questions',
+                    'module': {'module_number': '$modules.module_number', 'title': '$modules.title'}
+                }}
+            ]))
+            if not rows:
+                return None, None
+            
+            result = (rows[0].get('title'), [row for row in rows if row.get('question')])
+            self._cache_set(('quiz_questions', course_id), result)
+            return result
+        except Exception as e:
+            logger.error("❌ Error getting course quiz questions: %s", e)
+            return None, None
+    
+    @staticmethod
+    def _array_size(path):
+        """Aggregation expression: length of the array at path, 0 if missing or not an array"""
+        return {'$cond': [{'$isArray': path}, {'$size': path}, 0]}
+    
     def get_recent_courses(self, limit=5):
         """Get recent courses with enhanced data"""
         if not self.is_connected() or self.courses_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return self._get_mock_recent_courses(limit)
         
         try:
-            courses = list(self.courses_collection.find()
-                         .sort("created_at", -1)
-                         .limit(limit))
+            cached = self._cache_get(('recent', limit))
+            if cached is not None:
+                return cached
+            
+            # Only the card fields - never ship module content/quizzes just to count them
+            course_fields = ('title', 'description', 'total_modules', 'difficulty', 'learning_pace', 'depth_level',
+                             'estimated_duration', 'include_practical', 'include_case_studies', 'include_exam_prep')
+            courses = list(self.courses_collection.aggregate([
+                {'$sort': {'created_at': -1}},
+                {'$limit': limit},
+                {'$project': {
+                    '_id': {'$toString': '$_id'},
+                    'content_id': 1,
+                    'created_at': 1,
+                    'has_course': {'$eq': [{'$type': '$course_structure.course'}, 'object']},
+                    'course': {field: f'$course_structure.course.{field}' for field in course_fields},
+                    'modules_count': self._array_size('$course_structure.course.modules'),
+                    'flashcards_count': self._array_size('$course_structure.course.flashcards')
+                }}
+            ]))
             
-            # Convert ObjectId to string and enhance data
+            # Enhance data (_id already stringified by the pipeline)
+            now = datetime.now()  # Fallback stamp for documents without created_at
             enhanced_courses = []
             for course in courses:
-                course['_id'] = str(course['_id'])
-                
                 # Extract course info for display
-                if 'course_structure' in course and 'course' in course['course_structure']:
-                    course_data = course['course_structure']['course']
+                if course.get('has_course'):
+                    course_data = course.get('course', {})
                     enhanced_course = {
                         '_id': course['_id'],
                         'content_id': course.get('content_id', ''),
@@ -170,9 +488,9 @@ class MongoDBManager:
                         'learning_pace': course_data.get('learning_pace', 'medium'),
                         'depth_level': course_data.get('depth_level', 'comprehensive'),
                         'estimated_duration': course_data.get('estimated_duration', 'Unknown'),
-                        'created_at': course.get('created_at', datetime.now()),
-                        'modules_count': len(course_data.get('modules', [])),
-                        'flashcards_count': len(course_data.get('flashcards', [])),
+                        'created_at': course.get('created_at', now),
+                        'modules_count': course['modules_count'],
+                        'flashcards_count': course['flashcards_count'],
                         'has_practical': course_data.get('include_practical', False),
                         'has_case_studies': course_data.get('include_case_studies', False),
                         'has_exam_prep': course_data.get('include_exam_prep', False)
@@ -186,56 +504,103 @@ class MongoDBManager:
                         'description': 'AI-generated learning course',
                         'total_modules': 4,
                         'difficulty': 'intermediate',
-                        'created_at': course.get('created_at', datetime.now())
+                        'created_at': course.get('created_at', now)
                     })
             
-            # Include recent partials if any (for batching visibility)
-            partials = list(self.partial_courses_collection.find()
-                          .sort("created_at", -1)
-                          .limit(2))
+            # Include recent partials (for batching visibility) only in slots real courses left free
+            spare_slots = min(2, limit - len(enhanced_courses))
+            partials = self.partial_courses_collection.aggregate([
+                {'$sort': {'created_at': -1}},
+                {'$limit': spare_slots},
+                {'$project': {
+                    '_id': {'$concat': ['partial_', {'$toString': '$_id'}]},
+                    'batch_num': 1, 'total_batches': 1, 'created_at': 1, 'course_partial.total_modules': 1
+                }}
+            ]) if spare_slots > 0 else []
             for partial in partials:
-                partial['_id'] = str(partial['_id'])
                 enhanced_courses.append({
-                    '_id': f"partial_{partial['_id']}",
+                    '_id': partial['_id'],
                     'title': f'Partial Course (Batch {partial["batch_num"]}/{partial["total_batches"]})',
                     'description': 'In-progress batched course',
                     'total_modules': partial.get('course_partial', {}).get('total_modules', 0),
-                    'created_at': partial.get('created_at', datetime.now()),
+                    'created_at': partial.get('created_at', now),
                     'is_partial': True
                 })
             
+            self._cache_set(('recent', limit), enhanced_courses)
             return enhanced_courses
         except Exception as e:
-            print(f"❌ Error getting recent courses: {e}")
+            logger.error("❌ Error getting recent courses: %s", e)
             return self._get_mock_recent_courses(limit)
     
     # NEW: Partial course methods for batching
     def save_partial_course(self, partial_data, content_id, batch_num, total_batches):
         """Save partial course data for batched generation"""
         if not self.is_connected() or self.partial_courses_collection is None:
-            print("⚠️ MongoDB not connected, using mock partial ID")
-            return f"mock_partial_batch_{batch_num}_{content_id}"
+            logger.warning("⚠️ MongoDB not connected, partial not saved")
+            return None
         
         try:
+            now = datetime.now()
             partial_doc = {
                 'content_id': content_id,
                 'batch_num': batch_num,
                 'total_batches': total_batches,
                 'course_partial': partial_data,  # {'course': {...}}
-                'created_at': datetime.now(),
-                'updated_at': datetime.now()
+                'created_at': now,
+                'updated_at': now
             }
             result = self.partial_courses_collection.insert_one(partial_doc)
-            print(f"✅ Partial course (batch {batch_num}/{total_batches}) saved with ID: {result.inserted_id}")
+            logger.debug("✅ Partial course (batch %s/%s) saved with ID: %s", batch_num, total_batches, result.inserted_id)
             return str(result.inserted_id)
         except Exception as e:
-            print(f"❌ Error saving partial course: {e}")
-            return f"mock_partial_batch_{batch_num}_{content_id}_{datetime.now().timestamp()}"
+            logger.error("❌ Error saving partial course: %s", e)
+            return None
+    
+    def save_partials_bulk(self, partials, content_id, total_batches):
+        """Store the batch partials of an incomplete generation in one acknowledged bulk_write
+
+        partials is a list of (batch_num, partial_data) pairs. Each batch replaces any stale partial
+        with the same (content_id, batch_num), and partials of batches missing from this run are
+        removed, so a later merge never mixes two generations.
+        """
+        if not partials:
+            return 0
+        if not self.is_connected() or self.partial_courses_collection is None:
+            logger.warning("⚠️ MongoDB not connected, partials not saved")
+            return 0
+        
+        try:
+            now = datetime.now()
+            operations = [ReplaceOne(
+                {'content_id': content_id, 'batch_num': batch_num},
+                {
+                    'content_id': content_id,
+                    'batch_num': batch_num,
+                    'total_batches': total_batches,
+                    'course_partial': partial_data,  # {'course': {...}}
+                    'created_at': now,
+                    'updated_at': now
+                },
+                upsert=True
+            ) for batch_num, partial_data in partials]
+            operations.append(DeleteMany({
+                'content_id': content_id,
+                'batch_num': {'$nin': [batch_num for batch_num, _ in partials]}
+            }))
+            # The ops touch disjoint batches - ordered=False lets the server apply them in parallel
+            result = self.partial_courses_collection.bulk_write(operations, ordered=False)
+            saved = result.upserted_count + result.matched_count
+            logger.debug("✅ %s/%s partial batches saved in one write", saved, total_batches)
+            return saved
+        except Exception as e:
+            logger.error("❌ Error saving partials: %s", e)
+            return 0
     
     def get_partial_course(self, content_id, batch_num):
         """Get specific partial course by content_id and batch_num"""
         if not self.is_connected() or self.partial_courses_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return self._create_mock_partial(content_id, batch_num)
         
         try:
@@ -248,76 +613,86 @@ class MongoDBManager:
                 return partial
             return None
         except Exception as e:
-            print(f"❌ Error getting partial course: {e}")
+            logger.error("❌ Error getting partial course: %s", e)
             return None
     
+    def delete_partials(self, content_id):
+        """Remove all partials for a content_id without waiting for acknowledgement"""
+        if not self.is_connected() or self.partial_courses_unacked is None:
+            return False
+        
+        try:
+            self.partial_courses_unacked.delete_many({"content_id": content_id})
+            return True
+        except Exception as e:
+            logger.error("❌ Error deleting partials: %s", e)
+            return False
+    
     def merge_partials_to_full(self, content_id):
         """Merge all partials for a content_id into a full course and save"""
         if not self.is_connected():
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return None
         
         try:
-            # Get all partials for this content_id
-            partials = list(self.partial_courses_collection.find({
-                "content_id": content_id
-            }).sort("batch_num", 1))
-            
-            if not partials or len(partials) < 1:
-                print("❌ No partials found to merge")
-                return None
+            # Merge server-side: modules concatenated in batch order, metadata from the first batch,
+            # flashcards/bonus from the last; only complete sets of partials are written
+            full_id = ObjectId()
+            self.partial_courses_collection.aggregate([
+                {'$match': {'content_id': content_id}},
+                {'$sort': {'batch_num': 1}},
+                {'$group': {
+                    '_id': '$content_id',
+                    'count': {'$sum': 1},
+                    'total_batches': {'$first': '$total_batches'},
+                    'first': {'$first': '$course_partial.course'},
+                    'last': {'$last': '$course_partial.course'},
+                    'modules': {'$push': {'$ifNull': ['$course_partial.course.modules', []]}},
+                    'partial_ids': {'$push': {'$toString': '$_id'}}
+                }},
+                {'$match': {'$expr': {'$eq': ['$count', {'$ifNull': ['$total_batches', '$count']}]}}},
+                {'$set': {'modules': {'$reduce': {
+                    'input': '$modules', 'initialValue': [], 'in': {'$concatArrays': ['$$value', '$$this']}
+                }}}},
+                {'$project': {
+                    '_id': {'$literal': full_id},
+                    'content_id': '$_id',
+                    'course_structure': {'course': {'$mergeObjects': ['$first', {
+                        'modules': '$modules',
+                        'flashcards': {'$ifNull': ['$last.flashcards', []]},
+                        'course_completion_bonus': {'$ifNull': ['$last.course_completion_bonus', {}]},
+                        'total_modules': {'$size': '$modules'}
+                    }]}},
+                    'settings_used': {'$literal': {}},  # Will be filled by caller
+                    'merged_from_partials': '$partial_ids',
+                    'created_at': {'$literal': datetime.now()},
+                    'source': 'merged_batched'
+                }},
+                {'$merge': {'into': self.courses_collection.name, 'whenMatched': 'fail', 'whenNotMatched': 'insert'}}
+            ])
             
-            total_batches = partials[0].get('total_batches', len(partials))
-            if len(partials) != total_batches:
-                print(f"⚠️ Incomplete partials: {len(partials)}/{total_batches}")
+            merged = self.courses_collection.find_one({"_id": full_id})
+            if not merged:
+                logger.warning("⚠️ No complete set of partials to merge for %s", content_id)
                 return None
             
-            # Merge logic (simple append of modules, flashcards from last)
-            merged_modules = []
-            merged_flashcards = []
-            merged_bonus = {}
-            metadata = partials[0]['course_partial']['course'].copy()  # Metadata from first
-            
-            for partial in partials:
-                partial_course = partial['course_partial']['course']
-                merged_modules.extend(partial_course.get('modules', []))
-                if partial['batch_num'] == total_batches:  # Last batch has flashcards/bonus
-                    merged_flashcards = partial_course.get('flashcards', [])
-                    merged_bonus = partial_course.get('course_completion_bonus', {})
-            
-            metadata['modules'] = merged_modules
-            metadata['flashcards'] = merged_flashcards
-            metadata['course_completion_bonus'] = merged_bonus
-            metadata['total_modules'] = len(merged_modules)
-            
-            # Save merged as full course
-            full_course_data = {
-                "content_id": content_id,
-                "course_structure": {'course': metadata},
-                "settings_used": {},  # Will be filled by caller
-                "merged_from_partials": [str(p['_id']) for p in partials],
-                "created_at": datetime.now(),
-                "source": "merged_batched"
-            }
-            
-            # Insert full course
-            result = self.courses_collection.insert_one(full_course_data)
-            full_id = str(result.inserted_id)
+            self.invalidate_cache(('course_by_content', content_id))
+            self.invalidate_cache_kind('recent', 'stats')
             
             # Optional: Remove partials after merge
-            self.partial_courses_collection.delete_many({"content_id": content_id})
+            self.delete_partials(content_id)
             
-            print(f"✅ Merged {total_batches} partials into full course ID: {full_id}")
-            return self.courses_collection.find_one({"_id": ObjectId(full_id)})
+            logger.info("✅ Merged %s partials into full course ID: %s", len(merged['merged_from_partials']), full_id)
+            return merged
             
         except Exception as e:
-            print(f"❌ Error merging partials: {e}")
+            logger.error("❌ Error merging partials: %s", e)
             return None
     
     def update_course_progress(self, course_id, module_number, progress_data):
         """Update user progress for a course"""
         if not self.is_connected() or self.user_sessions_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return False
         
         try:
@@ -335,33 +710,29 @@ class MongoDBManager:
             )
             return result.acknowledged
         except Exception as e:
-            print(f"❌ Error updating progress: {e}")
+            logger.error("❌ Error updating progress: %s", e)
             return False
     
     def get_course_progress(self, course_id):
         """Get user progress for a course"""
         if not self.is_connected() or self.user_sessions_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return {}
         
         try:
-            progress_data = list(self.user_sessions_collection.find(
-                {'course_id': course_id}
-            ).sort('module_number', 1))
-            
-            # Convert ObjectId to string
-            for progress in progress_data:
-                progress['_id'] = str(progress['_id'])
-            
-            return progress_data
+            return list(self.user_sessions_collection.aggregate([
+                {'$match': {'course_id': course_id}},
+                {'$sort': {'module_number': 1}},
+                {'$addFields': {'_id': {'$toString': '$_id'}}}
+            ]))
         except Exception as e:
-            print(f"❌ Error getting progress: {e}")
+            logger.error("❌ Error getting progress: %s", e)
             return {}
     
     def save_user_quiz_results(self, course_id, module_number, quiz_results):
         """Save user quiz results"""
         if not self.is_connected() or self.user_sessions_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return False
         
         try:
@@ -375,127 +746,167 @@ class MongoDBManager:
             }
             
             result = self.user_sessions_collection.insert_one(quiz_data)
+            self.invalidate_cache(
+                ('course', course_id), ('quiz', course_id), ('modules_by_num', course_id), ('quiz_questions', course_id)
+            )
             return result.acknowledged
         except Exception as e:
-            print(f"❌ Error saving quiz results: {e}")
+            logger.error("❌ Error saving quiz results: %s", e)
             return False
     
     def get_user_quiz_results(self, course_id):
         """Get user quiz results for a course"""
         if not self.is_connected() or self.user_sessions_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
             return []
         
         try:
-            quiz_results = list(self.user_sessions_collection.find(
-                {'course_id': course_id, 'quiz_results': {'$exists': True}}
-            ).sort('completed_at', -1))
-            
-            # Convert ObjectId to string
-            for result in quiz_results:
-                result['_id'] = str(result['_id'])
-            
-            return quiz_results
+            return list(self.user_sessions_collection.aggregate([
+                {'$match': {'course_id': course_id, 'quiz_results': {'$exists': True}}},
+                {'$sort': {'completed_at': -1}},
+                {'$addFields': {'_id': {'$toString': '$_id'}}}
+            ]))
         except Exception as e:
-            print(f"❌ Error getting quiz results: {e}")
+            logger.error("❌ Error getting quiz results: %s", e)
             return []
     
     def save_learning_analytics(self, analytics_data):
-        """Save learning analytics data"""
+        """Queue learning analytics data; flushed in bulk every ANALYTICS_FLUSH_SIZE events or ANALYTICS_FLUSH_INTERVAL seconds"""
         if not self.is_connected() or self.analytics_collection is None:
-            print("⚠️ MongoDB not connected")
+            logger.warning("⚠️ MongoDB not connected")
+            return False
+        
+        analytics_data['created_at'] = datetime.now()
+        with self._analytics_lock:
+            self._analytics_buffer.append(analytics_data)
+            pending = len(self._analytics_buffer)
+        
+        if pending >= self._analytics_flush_size:
+            return self.flush_analytics()
+        # Make sure buffered events are written even if traffic stops
+        self._arm_analytics_flush()
+        return True
+    
+    def _arm_analytics_flush(self):
+        """Start one flush timer unless one is already pending (flush_analytics disarms it)"""
+        with self._analytics_lock:
+            if self._analytics_flush_armed:
+                return
+            self._analytics_flush_armed = True
+        timer = threading.Timer(self._analytics_flush_interval, self.flush_analytics)
+        timer.daemon = True
+        timer.start()
+    
+    def flush_analytics(self):
+        """Write all buffered analytics events in one unordered insert_many; on a connection error they are re-queued for the next flush"""
+        with self._analytics_lock:
+            events, self._analytics_buffer = self._analytics_buffer, []
+            self._analytics_flush_armed = False
+        if not events or not self.is_connected() or self.analytics_collection is None:
+            return True
+        
+        try:
+            result = self.analytics_collection.insert_many(events, ordered=False)
+            return result.acknowledged
+        except BulkWriteError as e:
+            # Unordered insert: the rest were written, retrying the rejected documents would fail again
+            logger.error("❌ Dropped %s of %s analytics events: %s",
+                         len(e.details.get('writeErrors', [])), len(events), e)
+            return False
+        except Exception as e:
+            self._requeue_analytics(events)
+            logger.error("❌ Error saving analytics, %s events re-queued: %s", len(events), e)
+            return False
+    
+    def _requeue_analytics(self, events):
+        """Put unsaved events back in front of the buffer, keeping at most ANALYTICS_MAX_BUFFER (newest win)"""
+        with self._analytics_lock:
+            buffer = events + self._analytics_buffer
+            dropped = len(buffer) - self._analytics_max_buffer
+            if dropped > 0:
+                buffer = buffer[dropped:]
+                logger.warning("⚠️ Analytics buffer full, dropped %s oldest events", dropped)
+            self._analytics_buffer = buffer
+        # Retry after the flush interval instead of waiting for ANALYTICS_FLUSH_SIZE new events
+        self._arm_analytics_flush()
+    
+    def save_job(self, job_data):
+        """Upsert background job status so any worker can answer polling requests"""
+        if not self.is_connected() or self.jobs_collection is None:
             return False
         
         try:
-            analytics_data['created_at'] = datetime.now()
-            result = self.analytics_collection.insert_one(analytics_data)
+            result = self.jobs_collection.update_one(
+                {'job_id': job_data['job_id']},
+                {'$set': job_data},
+                upsert=True
+            )
             return result.acknowledged
         except Exception as e:
-            print(f"❌ Error saving analytics: {e}")
+            logger.error("❌ Error saving job status: %s", e)
+            return False
+    
+    def get_job(self, job_id):
+        """Get background job status by job ID"""
+        if not self.is_connected() or self.jobs_collection is None:
+            return None
+        
+        try:
+            return self.jobs_collection.find_one({'job_id': job_id}, {'_id': 0})
+        except Exception as e:
+            logger.error("❌ Error getting job status: %s", e)
+            return None
+    
+    def get_cached_course(self, cache_key):
+        """Get a previously generated course result by content+settings hash (read cache first)"""
+        local = self._cache_get(('course_cache', cache_key))
+        if local is not None:
+            return local
+        
+        if not self.is_connected() or self.course_cache_collection is None:
+            return None
+        
+        try:
+            cached = self.course_cache_collection.find_one({'cache_key': cache_key}, {'_id': 0, 'course_result': 1})
+            if not cached:
+                return None
+            self._cache_set(('course_cache', cache_key), cached['course_result'])
+            return cached['course_result']
+        except Exception as e:
+            logger.error("❌ Error reading course cache: %s", e)
+            return None
+    
+    def save_cached_course(self, cache_key, course_result):
+        """Store a generated course result (expires via TTL index)"""
+        self._cache_set(('course_cache', cache_key), course_result)
+        if not self.is_connected() or self.course_cache_collection is None:
+            return False
+        
+        try:
+            result = self.course_cache_collection.update_one(
+                {'cache_key': cache_key},
+                {'$set': {'course_result': course_result, 'created_at': datetime.now()}},
+                upsert=True
+            )
+            return result.acknowledged
+        except Exception as e:
+            logger.error("❌ Error saving course cache: %s", e)
             return False
     
     def _create_mock_course(self, content_id):
-        """Create mock course data for testing"""
-        return {
-            "_id": "mock_course_id_123",
-            "content_id": content_id,
-            "course_structure": {
-                "course": {
-                    "title": "Data Communications & Networking",
-                    "description": "Comprehensive course on networking fundamentals",
-                    "total_modules": 4,
-                    "difficulty": "intermediate",
-                    "learning_pace": "medium",
-                    "depth_level": "comprehensive",
-                    "estimated_duration": "3 hours",
-                    "include_practical": True,
-                    "include_case_studies": True,
-                    "include_exam_prep": True,
-                    "modules": [
-                        {
-                            "module_number": 1,
-                            "title": "Introduction to Networking",
-                            "learning_objectives": ["Understand basic concepts", "Learn protocols"],
-                            "content": {
-                                "introduction": "Networking basics",
-                                "sections": [{"heading": "Concepts", "content": "Basic networking concepts"}],
-                                "conclusion": "Summary"
-                            },
-                            "quiz": {
-                                "questions": [
-                                    {
-                                        "question": "What is a network?",
-                                        "options": ["A) Connected devices", "B) Single computer", "C) Software", "D) None"],
-                                        "correct_answer": "A",
-                                        "explanation": "Network means connected devices"
-                                    }
-                                ]
-                            },
-                            "practical_exercises": [
-                                {
-                                    "title": "Network Setup Simulation",
-                                    "description": "Set up a basic network topology",
-                                    "steps": ["Step 1: Identify devices", "Step 2: Connect cables", "Step 3: Configure IP addresses"],
-                                    "expected_outcome": "Working network connection"
-                                }
-                            ],
-                            "important_topics": ["OSI Model", "TCP/IP", "Network Topologies"],
-                            "exam_questions": [
-                                {
-                                    "question": "Explain the OSI model layers",
-                                    "type": "descriptive",
-                                    "marks": 10,
-                                    "importance": "high"
-                                }
-                            ]
-                        }
-                    ],
-                    "flashcards": [
-                        {"front": "LAN", "back": "Local Area Network", "mnemonic": "Small network"}
-                    ]
-                }
-            },
-            "created_at": datetime.now()
-        }
+        """Create mock course data for testing (nested structure is shared - treat as read-only)"""
+        return {**_MOCK_COURSE_TEMPLATE, "content_id": content_id, "created_at": datetime.now()}
     
     def _get_mock_recent_courses(self, limit):
         """Get mock recent courses for testing"""
+        now = datetime.now()
         return [
             {
+                **_MOCK_RECENT_COURSE,
                 "_id": f"mock_course_{i}",
                 "title": f"Course {i} - Data Communications",
                 "description": f"Mock course description {i}",
-                "total_modules": 4,
-                "difficulty": "intermediate",
-                "learning_pace": "medium",
-                "depth_level": "comprehensive",
-                "estimated_duration": "2 hours",
-                "created_at": datetime.now(),
-                "modules_count": 4,
-                "flashcards_count": 8,
-                "has_practical": True,
-                "has_case_studies": True,
-                "has_exam_prep": True
+                "created_at": now
             }
             for i in range(1, limit + 1)
         ]
@@ -523,16 +934,22 @@ class MongoDBManager:
             return {"error": "Database not connected"}
         
         try:
+            cached = self._cache_get(('stats',))
+            if cached is not None:
+                return cached
+            
+            # estimated_document_count reads collection metadata instead of scanning
             stats = {
-                "content_count": self.content_collection.count_documents({}),
-                "courses_count": self.courses_collection.count_documents({}),
-                "partials_count": self.partial_courses_collection.count_documents({}),
-                "sessions_count": self.user_sessions_collection.count_documents({}),
-                "analytics_count": self.analytics_collection.count_documents({}),
-                "recent_activity": list(self.courses_collection.find()
-                                      .sort("created_at", -1)
-                                      .limit(3))
+                "content_count": self.content_collection.estimated_document_count(),
+                "courses_count": self.courses_collection.estimated_document_count(),
+                "partials_count": self.partial_courses_collection.estimated_document_count(),
+                "sessions_count": self.user_sessions_collection.estimated_document_count(),
+                "analytics_count": self.analytics_collection.estimated_document_count(),
+                "recent_activity": list(self.courses_collection.find(
+                    {}, {'content_id': 1, 'created_at': 1, 'source': 1, 'course_structure.course.title': 1}
+                ).sort("created_at", -1).limit(3))
             }
+            self._cache_set(('stats',), stats)
             return stats
         except Exception as e:
             return {"error": str(e)}
@@ -541,7 +958,77 @@ class MongoDBManager:
         """Close database connection"""
         if self.client:
             self.client.close()
-            print("✅ MongoDB connection closed")
+            logger.info("✅ MongoDB connection closed")
+
+class MockMongoDBManager(MongoDBManager):
+    """In-memory stand-in selected at boot (BRAINFORGE_MOCK=1) - never touches MongoDB"""
+    
+    def __init__(self):
+        self._read_cache = TTLCache(maxsize=1, ttl=1)
+        self._read_cache_lock = threading.Lock()
+        self._last_ping_ts = 0.0
+        self._last_ping_ok = False
+        self._analytics_buffer = []
+        self._analytics_lock = threading.Lock()
+        self._analytics_flush_armed = False
+        self.client = None
+        self.db = None
+        self.content_collection = None
+        self.courses_collection = None
+        self.user_sessions_collection = None
+        self.analytics_collection = None
+        self.partial_courses_collection = None
+        self.partial_courses_unacked = None
+        self.jobs_collection = None
+        self.course_cache_collection = None
+        logger.info("🧪 Using mock database")
+    
+    def save_extracted_content(self, content_data):
+        return f"mock_content_id_{datetime.now().timestamp()}"
+    
+    def get_content_by_id(self, content_id):
+        return {
+            "_id": content_id,
+            "filename": "mock_file.pdf",
+            "content": "Mock content for testing",
+            "source_type": "pdf",
+            "length": 100,
+            "created_at": datetime.now()
+        }
+    
+    def save_course_structure(self, course_data):
+        return f"mock_course_id_{datetime.now().timestamp()}"
+    
+    def get_course_by_content_id(self, content_id):
+        return self._create_mock_course(content_id)
+    
+    def get_course_by_id(self, course_id):
+        return self._create_mock_course(course_id)
+    
+    def get_course_quiz_only(self, course_id):
+        return self._create_mock_course(course_id)
+    
+    def get_quiz_modules(self, course_id):
+        course = self._create_mock_course(course_id)
+        modules = course['course_structure']['course'].get('modules', [])
+        return course, modules, {m.get('module_number'): m for m in reversed(modules)}
+    
+    def get_course_quiz_questions(self, course_id):
+        course, modules, _ = self.get_quiz_modules(course_id)
+        questions = [
+            {'question': q, 'module': {k: m[k] for k in ('module_number', 'title') if k in m}}
+            for m in modules for q in m.get('quiz', {}).get('questions', [])
+        ]
+        return course['course_structure']['course'].get('title'), questions
+    
+    def get_recent_courses(self, limit=5):
+        return self._get_mock_recent_courses(limit)
+    
+    def save_partial_course(self, partial_data, content_id, batch_num, total_batches):
+        return f"mock_partial_batch_{batch_num}_{content_id}"
+    
+    def get_partial_course(self, content_id, batch_num):
+        return self._create_mock_partial(content_id, batch_num)
 
 # Test function
 def test_database():
@@ -617,4 +1104,8 @@ def test_database():
         print(f"❌ Database test error: {e}")
 
 if __name__ == "__main__":
-    test_database()
\ No newline at end of file
+    import sys
+    if '--init-indexes' in sys.argv:
+        MongoDBManager(bootstrap_indexes=True).close_connection()
+    else:
+        test_database()
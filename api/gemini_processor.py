@@ -2,38 +2,322 @@ import google.generativeai as genai
 import os
 import json
 import re
+import orjson
+from json_repair import repair_json
 from datetime import datetime
 from dotenv import load_dotenv
 import traceback
 import time
+import random
+import functools
+import threading
+import logging
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core import exceptions as google_exceptions
+
+if os.getenv('VERCEL') != '1':  # No .env on Vercel - skip the directory walk
+    load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+_RETRY_DELAY_RE = re.compile(r'retry(?:_delay\s*\{\s*seconds:\s*|\s+in\s+)([\d.]+)', re.IGNORECASE)
+
+# Response cleaning runs on every 30 KB model reply and every notes field - compile once
+_CODE_FENCE_RE = re.compile(r'```(?:json)?\s*')
+_BRACE_RE = re.compile(r'[{}]')
+_WHITESPACE_RE = re.compile(r'\s+')
+# Quiz option labels - only four options are ever kept
+_OPTION_LETTERS = ('A', 'B', 'C', 'D')
+_OPTION_PREFIXES = ('A)', 'B)', 'C)', 'D)')
+# Decorative symbols stripped from notes in one C-level pass
+_SYMBOL_TABLE = str.maketrans('', '', '*•⭐🎯🚀📚🔄💡🎨📋')
+
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `per_minute` acquisitions per rolling minute, bursts up to that size"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_rate = per_minute / 60.0  # tokens per second
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.refill_rate
+            time.sleep(wait)
+
+
+# Prompt JSON examples are serialized once at import; per-call values are swapped in by _fill_schema
+_COURSE_SCHEMA_TEMPLATE = json.dumps({
+    "course": {
+        "title": "Course Title",
+        "description": "Course description using all key concepts",
+        "total_modules": "__TOTAL_MODULES__",
+        "difficulty": "__DIFFICULTY__",
+        "learning_pace": "__LEARNING_PACE__",
+        "depth_level": "__DEPTH_LEVEL__",
+        "estimated_duration": "X-Y hours",
+        "learning_outcomes": ["Outcome 1", "Outcome 2"],
+        "prerequisites": ["Basic knowledge"],
+        "target_audience": "Target audience",
+        "modules": [
+            {
+                "module_number": 1,
+                "title": "Module Title",
+                "duration_estimate": "X hours",
+                "learning_objectives": ["Objective 1", "Objective 2"],
+                "key_concepts": ["Concept 1", "Concept 2"],
+                "content": {
+                    "introduction": "EMOJI POINT-WISE INTRODUCTION ONLY: 📍 **Key Term 1**: Explanation with example\n🔹 **Key Term 2**: Detailed point-wise explanation\n📋 Main concept overview in points",
+                    "sections": [
+                        {
+                            "heading": "Section Heading",
+                            "content": "EMOJI POINT-WISE CONTENT ONLY: 📍 **Important Term**: Detailed explanation with subpoints 1. Sub-detail A 2. Sub-detail B\n🔹 **Another Term**: Explanation with real examples\n📋 Practical applications in points",
+                            "notes_hierarchy": {
+                                "main_topic": "Main Topic",
+                                "subtopics": [
+                                    {
+                                        "subtopic": "Subtopic Name",
+                                        "points": ["📍 **Key Concept**: Point-wise explanation with real example", "🔹 **Another Concept**: Application details"],
+                                        "sub_points": ["📋 Sub-detail 1", "📍 Sub-detail 2"],
+                                        "important_concepts": [
+                                            "📍 **Concept Name**: Point-wise explanation with real-world examples and applications"
+                                        ]
+                                    }
+                                ],
+                                "key_takeaways": ["📍 **Takeaway 1** - key insight", "🔹 **Takeaway 2** - practical tip"]
+                            },
+                            "key_points": ["📍 **Key point 1**: Details", "🔹 **Key point 2**: More details"],
+                            "real_world_application": "Practical scenario with emoji points: 📍 Step 1: Description\n🔹 Step 2: Implementation",
+                            "common_mistakes": "📍 **Mistake 1**: Explanation\n🔹 **Mistake 2**: How to avoid",
+                            "best_practices": ["📍 **Practice 1**: Step-by-step", "🔹 **Practice 2**: Examples"]
+                        }
+                    ],
+                    "summary": "EMOJI POINT-WISE Module summary: 📍 **Main idea 1**\n🔹 **Main idea 2**"
+                },
+                "practical_exercises": [
+                    {
+                        "title": "Exercise Title",
+                        "description": "EMOJI POINT-WISE Description: 📍 Step 1\n🔹 Step 2",
+                        "steps": ["1. Step 1 details", "2. Step 2 with example"],
+                        "expected_outcome": "Expected result with emoji points"
+                    }
+                ],
+                "quiz": {
+                    "questions": [
+                        {
+                            "id": 1,
+                            "question": "Clear question text about the module content?",
+                            "options": [
+                                "A) First plausible option",
+                                "B) Second plausible option", 
+                                "C) Third plausible option",
+                                "D) Fourth plausible option"
+                            ],
+                            "correct_answer": "A",
+                            "explanation": "EMOJI POINT-WISE explanation: 📍 Why A is correct 1. Reason 1 2. Reason 2",
+                            "difficulty": "easy/medium/hard",
+                            "knowledgeArea": "Specific topic area",
+                            "commonMistake": "📍 Common mistake with points: 1. Error 2. Fix",
+                            "points": 5
+                        }
+                    ]
+                }
+            }
+        ],
+        "flashcards": [
+            # Generate exactly flashcards_count examples
+            {
+                "id": 1,
+                "front": "Question or term",
+                "back": "Clear answer without symbols - emoji point-wise if needed",
+                "mnemonic": "Memorization tip: e.g., acronym or story for easy recall",
+                "category": "Topic category",
+                "importance": "high - explain why",
+                "visual_cue": "Visual memory aid: imagine this image",
+                "related_concepts": ["📍 Related concept 1 with brief point", "🔹 Related concept 2"],
+                "difficulty": "easy/medium/hard"
+            }
+            # ... repeat pattern up to exactly flashcards_count
+        ],
+        "course_completion_bonus": {
+            "capstone_project": "EMOJI POINT-WISE Final project: 📍 Step 1\n🔹 Step 2",
+            "next_learning_steps": ["📍 Next topic 1", "🔹 Resource 2 with tips"]
+        }
+    }
+}, indent=2)
+
+
+@functools.lru_cache(maxsize=4)
+def _batch_schema_template(is_first, is_last):
+    """Batch JSON example - only first/last flags change its shape, so each variant is serialized once"""
+    return json.dumps({
+        "course": {
+            # For batch 1: Include metadata
+            "title": "Course Title" if is_first else "N/A (from batch 1)",
+            "description": "Full description" if is_first else "N/A",
+            # ... other metadata only for batch 1
+            "modules": [  # Exactly modules_per_batch[batch_num-1] modules
+                {
+                    "module_number": "__MODULE_NUMBER__",  # Sequential
+                    "title": "Module __MODULE_NUMBER_TEXT__: Detailed Title from content",
+                    "duration_estimate": "45-60 minutes",
+                    "learning_objectives": ["Objective from this segment", "Another from content"],
+                    "content": {
+                        "introduction": "EMOJI POINT-WISE INTRODUCTION ONLY: 📍 **Key Term 1**: Explanation with example\n🔹 **Key Term 2**: Detailed point-wise explanation\n📋 Main concept overview in points",
+                        "sections": [  # 3-5 sections per module, detailed
+                            {
+                                "heading": "Section from content",
+                                "content": "EMOJI POINT-WISE CONTENT ONLY: 📍 **Important Term**: Detailed explanation with subpoints 1. Sub-detail A 2. Sub-detail B\n🔹 **Another Term**: Explanation with real examples\n📋 Practical applications in points",
+                                "notes_hierarchy": {
+                                    "main_topic": "Key topic",
+                                    "subtopics": [{"subtopic": "Sub", "points": ["📍 **Key Concept**: Detailed point with real example"], "important_concepts": ["📍 **Concept**: Point-wise full explanation"]}],
+                                    "key_takeaways": ["📍 **Takeaway 1**", "🔹 **Takeaway 2**"]
+                                },
+                                "key_points": ["📍 **Bullet-free point 1**", "🔹 **More details point 2**"],
+                                "real_world_application": "Practical example emoji point-wise: 📍 Step 1: Description\n🔹 Step 2: Implementation",
+                                "common_mistakes": "📍 **Mistake 1** point\n🔹 **Mistake 2** explanation",
+                                "best_practices": ["📍 **Practice 1**", "🔹 **Practice 2**"]
+                            }
+                        ],
+                        "summary": "EMOJI POINT-WISE summary: 📍 **Main point 1**\n🔹 **Main point 2**"
+                    },
+                    "quiz": {
+                        "questions": [  # Exactly questions_per_module
+                            {
+                                "id": 1,
+                                "question": "Question based on this module's content?",
+                                "options": ["A) Correct from segment", "B) Wrong", "C) Wrong", "D) Wrong"],
+                                "correct_answer": "A",
+                                "explanation": "EMOJI POINT-WISE why A is correct: 📍 Reason 1\n🔹 Reason 2 referencing content",
+                                "difficulty": "medium",
+                                "knowledgeArea": "From module",
+                                "commonMistake": "📍 Common error point-wise",
+                                "points": 5
+                            }
+                            # ... more
+                        ]
+                    }
+                }
+                # ... more modules
+            ],
+            # Flashcards only in last batch - exactly flashcards_count
+            "flashcards": [] if not is_last else [
+                # Example pattern - repeat for exactly flashcards_count
+                {
+                    "id": 1,
+                    "front": "Term",
+                    "back": "Detailed back emoji point-wise if needed",
+                    "mnemonic": "Memorization tip: e.g., story or acronym",
+                    "category": "Category",
+                    "importance": "high - reason why important",
+                    "visual_cue": "Visual tip: picture this image",
+                    "related_concepts": ["📍 Related 1 with brief", "🔹 Related 2"],
+                    "difficulty": "medium"
+                }
+                # ... generate exactly flashcards_count in total for last batch
+            ],
+            "course_completion_bonus": {} if not is_last else {"capstone": "Project emoji point-wise"}
+        }
+    }, indent=2)
+
+
+def _fill_schema(template, values):
+    """Swap the quoted "__PLACEHOLDER__" tokens of a pre-serialized schema for JSON-encoded values"""
+    for placeholder, value in values.items():
+        template = template.replace(json.dumps(placeholder), json.dumps(value))
+    return template
+
+
+# Filler for missing flashcards - copied per card with its own id, front and list
+_PLACEHOLDER_FLASHCARD = {
+    "back": "Definition of key term",
+    "mnemonic": "Memory aid for term",
+    "category": "Fundamentals",
+    "importance": "high - reason why important",
+    "visual_cue": "Visual memory aid",
+    "difficulty": "medium"
+}
+
+# Constant parts of the fallback course - per-item fields (ids, numbers, lists) are filled per call
+_FALLBACK_OPTIONS = (
+    'A) First important concept',
+    'B) Second important concept',
+    'C) Third important concept',
+    'D) Fourth important concept'
+)
+_FALLBACK_QUESTION = {
+    'correct_answer': 'A',
+    'explanation': '📍 This is the most fundamental concept for this module. 🔹 Reason 1. 📋 Reason 2.',
+    'difficulty': 'medium',
+    'commonMistake': '📍 Confusing this with other similar concepts. 🔹 How to avoid: Focus on key differences.',
+    'points': 5
+}
+_FALLBACK_FLASHCARD = {
+    "category": "Fundamentals",
+    "importance": "high - crucial for understanding core concepts",
+    "difficulty": "medium"
+}
 
-load_dotenv()
 
 class GeminiCourseGenerator:
     def __init__(self):
+        self.max_concurrency = int(os.getenv('GEMINI_MAX_CONCURRENCY', 4))
+        # Process-wide gates shared by every generation: in-flight calls and requests per minute
+        self._call_slots = threading.BoundedSemaphore(self.max_concurrency)
+        # GEMINI_RPM is the deployment's whole quota - each of the BRAINFORGE_PROCESSES workers
+        # (exported by gunicorn.conf.py) gets an equal share, at least one request per minute
+        processes = max(1, int(os.getenv('BRAINFORGE_PROCESSES', 1)))
+        self._rate = RateLimiter(max(1.0, int(os.getenv('GEMINI_RPM', 60)) / processes))
+        # Up to this size every batch gets the whole content and only its module range; above it, segment
+        self.shared_content_limit = int(os.getenv('BATCH_SHARED_CONTENT_CHARS', 200000))
+        # Model and sampling settings are read once; configs are built once per output-token cap
+        self.model_name = os.getenv('GEMINI_MODEL', 'gemini-2.5-pro')
+        self._sampling = {
+            'temperature': float(os.getenv('GEMINI_TEMPERATURE', 0.7)),
+            'top_p': float(os.getenv('GEMINI_TOP_P', 0.95)),
+            'top_k': int(os.getenv('GEMINI_TOP_K', 40))
+        }
+        self._generation_configs = {}
+        
         try:
             api_key = os.getenv('GEMINI_API_KEY')
             if not api_key:
                 raise ValueError("GEMINI_API_KEY not found in environment variables")
             
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-pro')
-            print("✅ Gemini AI initialized successfully")
+            # REST goes through requests' (gevent-patched) sockets; gRPC's C core would block the
+            # whole gevent worker for the length of every call. GEMINI_TRANSPORT=grpc to opt back in.
+            genai.configure(api_key=api_key, transport=os.getenv('GEMINI_TRANSPORT', 'rest'))
+            self.model = genai.GenerativeModel(self.model_name)
+            logger.info("✅ Gemini AI initialized successfully")
         except Exception as e:
-            print(f"❌ Gemini AI initialization failed: {e}")
+            logger.error("❌ Gemini AI initialization failed: %s", e)
             self.model = None
     
-    def generate_course(self, content, settings, db_manager=None, content_id=None):
-        """Generate course with SMART CONTENT DISTRIBUTION and CLEAN NOTES"""
+    def generate_course(self, content, settings, db_manager=None, content_id=None, on_progress=None):
+        """Generate course with SMART CONTENT DISTRIBUTION and CLEAN NOTES
+
+        on_progress(modules_generated) is called while a single-request course streams in.
+        """
         if not self.model:
             return {"success": False, "error": "Gemini AI not initialized"}
         
         try:
-            print("🚀 Starting SMART course generation...")
-            print(f"📊 Content length: {len(content)} characters")
-            print(f"🎯 Modules requested: {settings.get('modules', 4)}")
-            print(f"❓ Questions per module: {settings.get('questions_per_module', 3)}")
-            print(f"🃏 Flashcards requested: {settings.get('flashcards', 15)}")
+            logger.info("🚀 Starting SMART course generation...")
+            logger.debug("📊 Content length: %s characters", len(content))
+            logger.debug("🎯 Modules requested: %s", settings.get('modules', 4))
+            logger.debug("❓ Questions per module: %s", settings.get('questions_per_module', 3))
+            logger.debug("🃏 Flashcards requested: %s", settings.get('flashcards', 15))
             
             total_modules = settings.get('modules', 4)
             questions_per_module = settings.get('questions_per_module', 3)
@@ -41,15 +325,14 @@ class GeminiCourseGenerator:
             # SMART BATCHING: More than 5 modules = use batching
             if total_modules > 5:
                 batches = self._calculate_optimal_batches(total_modules)
-                print(f"🔄 Using {batches} batches for {total_modules} modules")
+                logger.debug("🔄 Using %s batches for %s modules", batches, total_modules)
                 return self._generate_smart_batched_course(content, settings, db_manager, content_id, batches)
             else:
-                print("🔄 Single batch generation for optimal quality")
-                return self._generate_single_course_optimized(content, settings, questions_per_module)
+                logger.debug("🔄 Single batch generation for optimal quality")
+                return self._generate_single_course_optimized(content, settings, questions_per_module, on_progress)
             
         except Exception as e:
-            print(f"❌ Course generation error: {e}")
-            traceback.print_exc()
+            logger.exception("❌ Course generation error: %s", e)
             return {"success": False, "error": str(e)}
     
     def _calculate_optimal_batches(self, total_modules):
@@ -63,17 +346,26 @@ class GeminiCourseGenerator:
         else:
             return 4
     
-    def _generate_single_course_optimized(self, content, settings, questions_per_module=3):
+    def _estimate_output_tokens(self, settings, ceiling):
+        """Output-token cap sized to the requested course - bounds runaway generations, capped at ceiling"""
+        modules = settings.get('modules', 4)
+        estimate = (1500 + modules * 2500
+                    + modules * settings.get('questions_per_module', 3) * 300
+                    + settings.get('flashcards', 15) * 200)
+        return min(ceiling, estimate)
+    
+    def _generate_single_course_optimized(self, content, settings, questions_per_module=3, on_progress=None):
         """Single request generation with FULL CONTENT UTILIZATION"""
         prompt = self._create_optimized_prompt(content, settings, questions_per_module)
         
+        max_tokens = self._estimate_output_tokens(settings, 32768)
         start_time = time.time()
-        response = self._generate_with_retry(prompt, max_retries=2, max_tokens=32768)
+        response = self._generate_with_retry(prompt, max_retries=2, max_tokens=max_tokens, on_progress=on_progress)
         if not response:
             return {"success": False, "error": "Generation failed after retries"}
         
         generation_time = time.time() - start_time
-        print(f"⏱️  Single generation completed in {generation_time:.2f} seconds")
+        logger.info("⏱️  Single generation completed in %.2f seconds", generation_time)
         
         if not response.text:
             return {"success": False, "error": "Empty response from AI"}
@@ -87,77 +379,49 @@ class GeminiCourseGenerator:
             "source": "gemini_optimized_single",
             "settings_used": settings,
             "generation_time": generation_time,
-            "batched": False
+            "batched": False,
+            "fallback": course_data.get('fallback', False),
+            "repaired": course_data.get('repaired', False)
         }
     
     def _generate_smart_batched_course(self, content, settings, db_manager=None, content_id=None, total_batches=2):
         """Smart batched generation with balanced module distribution"""
         total_modules = settings.get('modules', 4)
-        questions_per_module = settings.get('questions_per_module', 3)
         
         # Calculate modules per batch (balanced distribution)
         modules_per_batch = self._calculate_modules_per_batch(total_modules, total_batches)
-        print(f"📦 Module distribution: {modules_per_batch}")
+        logger.debug("📦 Module distribution: %s", modules_per_batch)
         
         partial_available = False
         all_partials = []
-        batch_times = []
         
-        # Process each batch
-        for batch_num in range(1, total_batches + 1):
-            batch_modules = modules_per_batch[batch_num - 1]
-            print(f"🔄 Processing batch {batch_num}/{total_batches} with {batch_modules} modules")
-            
-            # Smart content segmentation for each batch
-            batch_content = self._get_content_segment(content, batch_num, total_batches, total_modules)
-            
-            batch_settings = settings.copy()
-            batch_settings['modules'] = batch_modules
-            
-            # First batch gets metadata, last batch gets flashcards
-            if batch_num == 1:
-                batch_settings['include_metadata'] = True
-                batch_settings['flashcards'] = 0
-            elif batch_num == total_batches:
-                batch_settings['include_metadata'] = False
-                batch_settings['flashcards'] = settings.get('flashcards', 15)
-            else:
-                batch_settings['include_metadata'] = False
-                batch_settings['flashcards'] = 0
-            
-            prompt = self._create_batch_prompt(
-                batch_content, batch_settings, batch_num, total_batches, 
-                modules_per_batch, all_partials
-            )
-            
-            start_time = time.time()
-            response = self._generate_with_retry(prompt, max_retries=2, max_tokens=16384)
-            batch_time = time.time() - start_time
-            batch_times.append(batch_time)
-            
-            if not response or not response.text:
-                print(f"❌ Batch {batch_num} failed")
+        # Batches are independent Gemini round-trips - run them concurrently
+        start_time = time.time()
+        results = self._generate_batches_concurrently(
+            content, settings, total_batches, modules_per_batch, total_modules
+        )
+        total_time = time.time() - start_time
+        batch_times = [batch_time for _, batch_time in results]
+        
+        partials_to_save = []
+        for batch_num, (partial, _) in enumerate(results, start=1):
+            if partial is None:
                 continue
-            
-            partial = self._parse_and_clean_course_response(response.text, batch_settings)
             all_partials.append(partial)
-            
-            # Save partial to DB if available
-            if db_manager and content_id:
-                partial_id = db_manager.save_partial_course(
-                    {'course': partial['course']}, content_id, batch_num, total_batches
-                )
-                print(f"💾 Saved partial batch {batch_num}/{total_batches}: {partial_id}")
-                partial_available = True
-            
-            print(f"✅ Batch {batch_num} completed in {batch_time:.2f}s")
+            if not partial.get('fallback'):
+                partials_to_save.append((batch_num, {'course': partial['course']}))
+        
+        # Keep the finished batches only when the course is incomplete - a full set is merged in memory below
+        if db_manager and content_id and partials_to_save and len(all_partials) < total_batches:
+            saved = db_manager.save_partials_bulk(partials_to_save, content_id, total_batches)
+            logger.debug("💾 Saved %s/%s partial batches", saved, total_batches)
+            partial_available = saved > 0
         
         # Merge all partials
         if len(all_partials) == total_batches:
             merged = self._merge_all_partials(all_partials, settings)
-            total_time = sum(batch_times)
             
-            print(f"⏱️  Batched generation completed in {total_time:.2f}s")
+            logger.info("⏱️  Batched generation completed in %.2fs (sum of batches: %.2fs)", total_time, sum(batch_times))
             
             return {
                 "success": True,
@@ -168,7 +432,9 @@ class GeminiCourseGenerator:
                 "batched": True,
                 "batches": total_batches,
                 "partial_available": partial_available,
-                "batch_times": batch_times
+                "batch_times": batch_times,
+                "fallback": any(partial.get('fallback') for partial in all_partials),
+                "repaired": any(partial.get('repaired') for partial in all_partials)
             }
         else:
             return {
@@ -178,6 +444,56 @@ class GeminiCourseGenerator:
                 "completed_batches": len(all_partials)
             }
     
+    def _generate_batches_concurrently(self, content, settings, total_batches, modules_per_batch, total_modules):
+        """Run every batch in a worker thread; results keep batch order
+
+        A plain thread pool rather than asyncio.run - under gevent's patch_all two overlapping
+        generations in one worker would see each other's event loop. _call_slots caps in-flight calls.
+        """
+        run_batch = functools.partial(
+            self._generate_batch, content, settings,
+            total_batches=total_batches, modules_per_batch=modules_per_batch, total_modules=total_modules
+        )
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, total_batches),
+                                thread_name_prefix='gemini-batch') as executor:
+            return list(executor.map(run_batch, range(1, total_batches + 1)))
+    
+    def _generate_batch(self, content, settings, batch_num, total_batches, modules_per_batch, total_modules):
+        """Generate a single batch - returns (partial or None, batch_time)"""
+        batch_modules = modules_per_batch[batch_num - 1]
+        logger.debug("🔄 Processing batch %s/%s with %s modules", batch_num, total_batches, batch_modules)
+        
+        # Send the whole content once per batch (no overlap duplication); segment only very large inputs
+        full_content = len(content) <= self.shared_content_limit
+        if full_content:
+            batch_content = content
+        else:
+            batch_content = self._get_content_segment(content, batch_num, total_batches, total_modules)
+        
+        # First batch gets metadata, last batch gets flashcards - overrides layered over settings, no copy
+        batch_settings = ChainMap({
+            'modules': batch_modules,
+            'include_metadata': batch_num == 1,
+            'flashcards': settings.get('flashcards', 15) if batch_num == total_batches and batch_num != 1 else 0
+        }, settings)
+        
+        prompt = self._create_batch_prompt(
+            batch_content, batch_settings, batch_num, total_batches,
+            modules_per_batch, full_content=full_content
+        )
+        
+        start_time = time.time()
+        response = self._generate_with_retry(prompt, max_retries=2, max_tokens=self._estimate_output_tokens(batch_settings, 16384))
+        batch_time = time.time() - start_time
+        
+        if not response or not response.text:
+            logger.error("❌ Batch %s failed", batch_num)
+            return None, batch_time
+        
+        partial = self._parse_and_clean_course_response(response.text, batch_settings)
+        logger.info("✅ Batch %s completed in %.2fs", batch_num, batch_time)
+        return partial, batch_time
+    
     def _calculate_modules_per_batch(self, total_modules, total_batches):
         """Calculate balanced module distribution across batches"""
         base_modules = total_modules // total_batches
@@ -203,22 +519,23 @@ class GeminiCourseGenerator:
         start_idx = (batch_num - 1) * segment_size
         end_idx = batch_num * segment_size if batch_num < total_batches else content_length
         
-        segment = content[start_idx:end_idx]
-        
-        # Add larger overlap from previous (except first batch) for context
+        # Collect the pieces and join once - each slice is copied exactly one more time
+        parts = []
         if batch_num > 1 and start_idx > 1000:
-            overlap = content[max(0, start_idx - 1000):start_idx]
-            segment = f"CONTEXT FROM PREVIOUS BATCH (OVERLAP FOR CONTINUITY): {overlap}\n\nMAIN CONTENT FOR THIS BATCH:\n{segment}"
+            # Add larger overlap from previous (except first batch) for context
+            parts += ["CONTEXT FROM PREVIOUS BATCH (OVERLAP FOR CONTINUITY): ", content[start_idx - 1000:start_idx],
+                      "\n\nMAIN CONTENT FOR THIS BATCH:\n"]
         elif batch_num == 1:
             # For first batch, emphasize full usage
-            segment = f"THIS IS THE FIRST BATCH - USE ALL PROVIDED CONTENT FOR MODULES 1-{total_modules//total_batches}: {segment}"
+            parts.append(f"THIS IS THE FIRST BATCH - USE ALL PROVIDED CONTENT FOR MODULES 1-{total_modules//total_batches}: ")
+        parts.append(content[start_idx:end_idx])
         
         # Balance: If segment too short (<20% of total), add more from next
-        if len(segment) < (content_length * 0.2) and batch_num < total_batches:
-            extra = content[end_idx:min(end_idx + 500, content_length)]
-            segment += f"\n\nADDITIONAL CONTEXT FOR COMPLETENESS: {extra}"
+        if sum(map(len, parts)) < (content_length * 0.2) and batch_num < total_batches:
+            parts += ["\n\nADDITIONAL CONTEXT FOR COMPLETENESS: ", content[end_idx:min(end_idx + 500, content_length)]]
         
-        print(f"📄 Batch {batch_num} content: {len(segment)} chars (overlap: {1000 if batch_num > 1 else 0})")
+        segment = "".join(parts)
+        logger.debug("📄 Batch %s content: %s chars (overlap: %s)", batch_num, len(segment), 1000 if batch_num > 1 else 0)
         return segment
     
     def _merge_all_partials(self, partials, settings):
@@ -255,14 +572,12 @@ class GeminiCourseGenerator:
                     'estimated_duration': course_data.get('estimated_duration', '')
                 })
             
-            # Add modules with corrected module numbers
-            for module in course_data.get('modules', []):
-                # Fix any camelCase to snake_case if present
-                if 'moduleNumber' in module:
-                    module['module_number'] = module.pop('moduleNumber')
+            # Add modules with corrected module numbers (any camelCase number is dropped, not read)
+            for module_counter, module in enumerate(course_data.get('modules', []), start=module_counter):
+                module.pop('moduleNumber', None)
                 module['module_number'] = module_counter
                 merged_course['modules'].append(module)
-                module_counter += 1
+            module_counter = len(merged_course['modules']) + 1
             
             # Add flashcards from last batch
             if i == len(partials) - 1:
@@ -273,41 +588,75 @@ class GeminiCourseGenerator:
         flashcard_count = settings.get('flashcards', 15)
         if len(merged_course['flashcards']) < flashcard_count:
             # Add placeholders if needed
-            for i in range(len(merged_course['flashcards']), flashcard_count):
-                merged_course['flashcards'].append({
+            merged_course['flashcards'].extend(
+                {
                     "id": i + 1,
                     "front": f"Key Term {i + 1}",
-                    "back": "Definition of key term",
-                    "mnemonic": "Memory aid for term",
-                    "category": "Fundamentals",
-                    "importance": "high - reason why important",
-                    "visual_cue": "Visual memory aid",
-                    "related_concepts": ["Related concept 1", "Related concept 2"],
-                    "difficulty": "medium"
-                })
+                    **_PLACEHOLDER_FLASHCARD,
+                    "related_concepts": ["Related concept 1", "Related concept 2"]
+                }
+                for i in range(len(merged_course['flashcards']), flashcard_count)
+            )
         
         return {'course': merged_course}
     
-    def _generate_with_retry(self, prompt, max_retries=2, max_tokens=16384):
-        """Generate with retry and backoff"""
+    def _generate_with_retry(self, prompt, max_retries=2, max_tokens=16384, on_progress=None):
+        """Generate with retry; backoff (with jitter) only after a failure, inside the concurrency and rate-limit gates
+
+        With on_progress the response is streamed and on_progress(modules_seen) fires as modules arrive.
+        """
         for attempt in range(max_retries + 1):
             try:
-                time.sleep(2 ** attempt)  # Exponential backoff
-                return self.model.generate_content(
-                    prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.7,
-                        top_p=0.95,
-                        top_k=40,
-                        max_output_tokens=max_tokens,
+                with self._call_slots:
+                    self._rate.acquire()
+                    response = self.model.generate_content(
+                        prompt,
+                        generation_config=self._generation_config(max_tokens),
+                        stream=on_progress is not None
                     )
-                )
+                    if on_progress is not None:
+                        self._consume_stream(response, on_progress)
+                    return response
+            except google_exceptions.ResourceExhausted as e:
+                # 429: wait as long as the server asks instead of guessing
+                match = _RETRY_DELAY_RE.search(str(e))
+                delay = float(match.group(1)) if match else min(30, 2 ** attempt + random.random())
+                logger.warning("⚠️ Generation attempt %s rate limited: %s", attempt + 1, e)
             except Exception as e:
-                print(f"⚠️ Generation attempt {attempt + 1} failed: {e}")
-                if attempt == max_retries:
-                    return None
+                delay = min(30, 2 ** attempt + random.random())
+                logger.warning("⚠️ Generation attempt %s failed: %s", attempt + 1, e)
+            
+            if attempt == max_retries:
+                return None
+            time.sleep(delay)
         return None
     
+    def _generation_config(self, max_tokens):
+        """GenerationConfig for an output-token cap, built on first use and reused afterwards"""
+        config = self._generation_configs.get(max_tokens)
+        if config is None:
+            config = self._generation_configs.setdefault(
+                max_tokens, genai.types.GenerationConfig(max_output_tokens=max_tokens, **self._sampling)
+            )
+        return config
+    
+    @staticmethod
+    def _consume_stream(response, on_progress):
+        """Drain a streamed response, reporting how many modules have started arriving"""
+        marker = '"module_number"'
+        modules_seen = 0
+        tail = ''
+        for chunk in response:
+            try:
+                text = tail + chunk.text
+            except ValueError:  # Chunk without text parts (e.g. safety metadata)
+                continue
+            found = text.count(marker)
+            if found:
+                modules_seen += found
+                on_progress(modules_seen)
+            tail = text[-(len(marker) - 1):]  # Catch a marker split across chunks, never count one twice
+    
     def _create_optimized_prompt(self, content, settings, questions_per_module=3):
         """Create optimized prompt with FULL CONTENT UTILIZATION and CLEAN NOTES"""
         
@@ -362,104 +711,12 @@ class GeminiCourseGenerator:
             "- Distribute across topics evenly, no less than specified",
             "",
             "📋 **RESPONSE STRUCTURE (STRICT JSON):**",
-            json.dumps({
-                "course": {
-                    "title": "Course Title",
-                    "description": "Course description using all key concepts",
-                    "total_modules": settings.get('modules', 4),
-                    "difficulty": settings.get('difficulty', 'beginner'),
-                    "learning_pace": settings.get('learning_pace', 'medium'),
-                    "depth_level": settings.get('depth_level', 'comprehensive'),
-                    "estimated_duration": "X-Y hours",
-                    "learning_outcomes": ["Outcome 1", "Outcome 2"],
-                    "prerequisites": ["Basic knowledge"],
-                    "target_audience": "Target audience",
-                    "modules": [
-                        {
-                            "module_number": 1,
-                            "title": "Module Title",
-                            "duration_estimate": "X hours",
-                            "learning_objectives": ["Objective 1", "Objective 2"],
-                            "key_concepts": ["Concept 1", "Concept 2"],
-                            "content": {
-                                "introduction": "EMOJI POINT-WISE INTRODUCTION ONLY: 📍 **Key Term 1**: Explanation with example\n🔹 **Key Term 2**: Detailed point-wise explanation\n📋 Main concept overview in points",
-                                "sections": [
-                                    {
-                                        "heading": "Section Heading",
-                                        "content": "EMOJI POINT-WISE CONTENT ONLY: 📍 **Important Term**: Detailed explanation with subpoints 1. Sub-detail A 2. Sub-detail B\n🔹 **Another Term**: Explanation with real examples\n📋 Practical applications in points",
-                                        "notes_hierarchy": {
-                                            "main_topic": "Main Topic",
-                                            "subtopics": [
-                                                {
-                                                    "subtopic": "Subtopic Name",
-                                                    "points": ["📍 **Key Concept**: Point-wise explanation with real example", "🔹 **Another Concept**: Application details"],
-                                                    "sub_points": ["📋 Sub-detail 1", "📍 Sub-detail 2"],
-                                                    "important_concepts": [
-                                                        "📍 **Concept Name**: Point-wise explanation with real-world examples and applications"
-                                                    ]
-                                                }
-                                            ],
-                                            "key_takeaways": ["📍 **Takeaway 1** - key insight", "🔹 **Takeaway 2** - practical tip"]
-                                        },
-                                        "key_points": ["📍 **Key point 1**: Details", "🔹 **Key point 2**: More details"],
-                                        "real_world_application": "Practical scenario with emoji points: 📍 Step 1: Description\n🔹 Step 2: Implementation",
-                                        "common_mistakes": "📍 **Mistake 1**: Explanation\n🔹 **Mistake 2**: How to avoid",
-                                        "best_practices": ["📍 **Practice 1**: Step-by-step", "🔹 **Practice 2**: Examples"]
-                                    }
-                                ],
-                                "summary": "EMOJI POINT-WISE Module summary: 📍 **Main idea 1**\n🔹 **Main idea 2**"
-                            },
-                            "practical_exercises": [
-                                {
-                                    "title": "Exercise Title",
-                                    "description": "EMOJI POINT-WISE Description: 📍 Step 1\n🔹 Step 2",
-                                    "steps": ["1. Step 1 details", "2. Step 2 with example"],
-                                    "expected_outcome": "Expected result with emoji points"
-                                }
-                            ],
-                            "quiz": {
-                                "questions": [
-                                    {
-                                        "id": 1,
-                                        "question": "Clear question text about the module content?",
-                                        "options": [
-                                            "A) First plausible option",
-                                            "B) Second plausible option", 
-                                            "C) Third plausible option",
-                                            "D) Fourth plausible option"
-                                        ],
-                                        "correct_answer": "A",
-                                        "explanation": "EMOJI POINT-WISE explanation: 📍 Why A is correct 1. Reason 1 2. Reason 2",
-                                        "difficulty": "easy/medium/hard",
-                                        "knowledgeArea": "Specific topic area",
-                                        "commonMistake": "📍 Common mistake with points: 1. Error 2. Fix",
-                                        "points": 5
-                                    }
-                                ]
-                            }
-                        }
-                    ],
-                    "flashcards": [
-                        # Generate exactly flashcards_count examples
-                        {
-                            "id": 1,
-                            "front": "Question or term",
-                            "back": "Clear answer without symbols - emoji point-wise if needed",
-                            "mnemonic": "Memorization tip: e.g., acronym or story for easy recall",
-                            "category": "Topic category",
-                            "importance": "high - explain why",
-                            "visual_cue": "Visual memory aid: imagine this image",
-                            "related_concepts": ["📍 Related concept 1 with brief point", "🔹 Related concept 2"],
-                            "difficulty": "easy/medium/hard"
-                        }
-                        # ... repeat pattern up to exactly flashcards_count
-                    ],
-                    "course_completion_bonus": {
-                        "capstone_project": "EMOJI POINT-WISE Final project: 📍 Step 1\n🔹 Step 2",
-                        "next_learning_steps": ["📍 Next topic 1", "🔹 Resource 2 with tips"]
-                    }
-                }
-            }, indent=2),
+            _fill_schema(_COURSE_SCHEMA_TEMPLATE, {
+                "__TOTAL_MODULES__": settings.get('modules', 4),
+                "__DIFFICULTY__": settings.get('difficulty', 'beginner'),
+                "__LEARNING_PACE__": settings.get('learning_pace', 'medium'),
+                "__DEPTH_LEVEL__": settings.get('depth_level', 'comprehensive')
+            }),
             "",
             "🎯 **FINAL INSTRUCTIONS:**",
             "1. USE ALL PROVIDED CONTENT COMPREHENSIVELY",
@@ -480,24 +737,47 @@ class GeminiCourseGenerator:
         
         return "\n".join(prompt_parts)
     
-    def _create_batch_prompt(self, content, settings, batch_num, total_batches, modules_per_batch, previous_partials):
-        """Create batch-specific prompt with continuity and quality focus"""
+    def _create_batch_prompt(self, content, settings, batch_num, total_batches, modules_per_batch, full_content=False):
+        """Create batch-specific prompt with quality focus (batches run concurrently - no previous-batch context)"""
         
         flashcards_count = settings.get('flashcards', 15)
-        
-        continuity_context = ""
-        if previous_partials:
-            # IMPROVED: More context - titles, objectives, and summaries from prev (up to 3000 chars)
-            prev_summary = ""
-            for partial in previous_partials[-2:]:  # Last 2 for recent context
-                mod_summ = partial['course'].get('modules', [])
-                prev_summary += f"Previous batch modules: {[m.get('title', 'Untitled') for m in mod_summ]} | Objectives: {partial['course'].get('learning_objectives', [])} | Key summary: {partial['course'].get('description', '')[:500]}\n"
-            continuity_context = f"CONTINUITY CONTEXT - BUILD ON THIS: {prev_summary[:3000]}"  # Increased to 3000
+        first_module = sum(modules_per_batch[:batch_num-1]) + 1
+        last_module = sum(modules_per_batch[:batch_num])
+        
+        if full_content:
+            # Every batch sees the same full text - the module range is what keeps batches apart
+            source_lines = [
+                f"Generating {settings['modules']} DETAILED modules for this batch from the FULL course content below.",
+                f"Total course: {sum(modules_per_batch)} modules across {total_batches} batches.",
+                "",
+                "📋 **BATCH SPECIFICS:**",
+                f"• This batch covers Modules {first_module} to {last_module} ONLY - other batches write the remaining modules",
+                f"• Split the content in order across all {sum(modules_per_batch)} modules and use the part that belongs to Modules {first_module}-{last_module}",
+            ]
+        else:
+            source_lines = [
+                f"Generating {settings['modules']} DETAILED modules for this batch using ONLY the provided content segment.",
+                f"Total course: {sum(modules_per_batch)} modules across {total_batches} batches.",
+                "",
+                "📋 **BATCH SPECIFICS:**",
+                f"• This batch covers Modules {first_module} to {last_module}",
+                "• Use segment content comprehensively - balance topics across modules",
+            ]
+        
+        # Guidelines that name the source differ between full-content and segment mode
+        if full_content:
+            coverage_rule = f"1. USE ONLY THE PART OF THE CONTENT FOR MODULES {first_module}-{last_module} - Distribute EVERY key concept from that part across the {settings['modules']} modules"
+            content_heading = f"📝 **FULL COURSE CONTENT (WRITE ONLY MODULES {first_module} to {last_module} FROM THEIR PART OF IT):**"
+            source_rule = f"1. Base modules on THE PART OF THE CONTENT FOR MODULES {first_module}-{last_module} - cover all its key ideas emoji point-wise with subpoints (use 📍, 🔹, 📋)"
+        else:
+            coverage_rule = f"1. USE ALL PROVIDED CONTENT SEGMENT - Distribute EVERY key concept from this batch's text across the {settings['modules']} modules"
+            content_heading = f"📝 **CONTENT FOR THIS BATCH (USE ALL OF IT FOR MODULES {first_module} to {last_module}):**"
+            source_rule = "1. Base modules on THIS BATCH'S CONTENT SEGMENT - cover all key ideas emoji point-wise with subpoints (use 📍, 🔹, 📋)"
         
         # Quality Guidelines (copied from single prompt for better notes)
         quality_guidelines = [
             "🚀 **KEY REQUIREMENTS FOR THIS BATCH:**",
-            f"1. USE ALL PROVIDED CONTENT SEGMENT - Distribute EVERY key concept from this batch's text across the {settings['modules']} modules",
+            coverage_rule,
             "2. **EMOJI POINT-WISE INTRODUCTION AND CONTENT**: All introductions and content sections MUST be in emoji point-wise format using 📍, 🔹, 📋",
             "3. **BOLD IMPORTANT TERMS**: Highlight key technical terms and concepts using **bold** format",
             "4. CLEAN FORMATTING: No hyphens (-), bullets (•), or traditional symbols - use emoji bullets 📍, 🔹 for all points",
@@ -506,97 +786,25 @@ class GeminiCourseGenerator:
             f"7. QUIZ: Exactly {settings.get('questions_per_module', 3)} questions per module with A/B/C/D options, explanations",
             f"8. FLASHCARDS (LAST BATCH ONLY): Generate EXACTLY {flashcards_count} with full fields: mnemonic (memorization tip), importance (high/medium/low with reason), visual_cue (image tip), related_concepts (emoji point-wise)",
             "",
-            "📝 **CONTENT FOR THIS BATCH (USE ALL OF IT FOR MODULES {sum(modules_per_batch[:batch_num-1]) + 1} to {sum(modules_per_batch[:batch_num])}):**"
+            content_heading
         ]
         
         # Full JSON structure example (enhanced like single prompt)
-        batch_json_example = json.dumps({
-            "course": {
-                # For batch 1: Include metadata
-                "title": "Course Title" if batch_num == 1 else "N/A (from batch 1)",
-                "description": "Full description" if batch_num == 1 else "N/A",
-                # ... other metadata only for batch 1
-                "modules": [  # Exactly modules_per_batch[batch_num-1] modules
-                    {
-                        "module_number": sum(modules_per_batch[:batch_num-1]) + 1,  # Sequential
-                        "title": f"Module {sum(modules_per_batch[:batch_num-1]) + 1}: Detailed Title from content",
-                        "duration_estimate": "45-60 minutes",
-                        "learning_objectives": ["Objective from this segment", "Another from content"],
-                        "content": {
-                            "introduction": "EMOJI POINT-WISE INTRODUCTION ONLY: 📍 **Key Term 1**: Explanation with example\n🔹 **Key Term 2**: Detailed point-wise explanation\n📋 Main concept overview in points",
-                            "sections": [  # 3-5 sections per module, detailed
-                                {
-                                    "heading": "Section from content",
-                                    "content": "EMOJI POINT-WISE CONTENT ONLY: 📍 **Important Term**: Detailed explanation with subpoints 1. Sub-detail A 2. Sub-detail B\n🔹 **Another Term**: Explanation with real examples\n📋 Practical applications in points",
-                                    "notes_hierarchy": {
-                                        "main_topic": "Key topic",
-                                        "subtopics": [{"subtopic": "Sub", "points": ["📍 **Key Concept**: Detailed point with real example"], "important_concepts": ["📍 **Concept**: Point-wise full explanation"]}],
-                                        "key_takeaways": ["📍 **Takeaway 1**", "🔹 **Takeaway 2**"]
-                                    },
-                                    "key_points": ["📍 **Bullet-free point 1**", "🔹 **More details point 2**"],
-                                    "real_world_application": "Practical example emoji point-wise: 📍 Step 1: Description\n🔹 Step 2: Implementation",
-                                    "common_mistakes": "📍 **Mistake 1** point\n🔹 **Mistake 2** explanation",
-                                    "best_practices": ["📍 **Practice 1**", "🔹 **Practice 2**"]
-                                }
-                            ],
-                            "summary": "EMOJI POINT-WISE summary: 📍 **Main point 1**\n🔹 **Main point 2**"
-                        },
-                        "quiz": {
-                            "questions": [  # Exactly questions_per_module
-                                {
-                                    "id": 1,
-                                    "question": "Question based on this module's content?",
-                                    "options": ["A) Correct from segment", "B) Wrong", "C) Wrong", "D) Wrong"],
-                                    "correct_answer": "A",
-                                    "explanation": "EMOJI POINT-WISE why A is correct: 📍 Reason 1\n🔹 Reason 2 referencing content",
-                                    "difficulty": "medium",
-                                    "knowledgeArea": "From module",
-                                    "commonMistake": "📍 Common error point-wise",
-                                    "points": 5
-                                }
-                                # ... more
-                            ]
-                        }
-                    }
-                    # ... more modules
-                ],
-                # Flashcards only in last batch - exactly flashcards_count
-                "flashcards": [] if batch_num != total_batches else [
-                    # Example pattern - repeat for exactly flashcards_count
-                    {
-                        "id": 1,
-                        "front": "Term",
-                        "back": "Detailed back emoji point-wise if needed",
-                        "mnemonic": "Memorization tip: e.g., story or acronym",
-                        "category": "Category",
-                        "importance": "high - reason why important",
-                        "visual_cue": "Visual tip: picture this image",
-                        "related_concepts": ["📍 Related 1 with brief", "🔹 Related 2"],
-                        "difficulty": "medium"
-                    }
-                    # ... generate exactly flashcards_count in total for last batch
-                ],
-                "course_completion_bonus": {} if batch_num != total_batches else {"capstone": "Project emoji point-wise"}
-            }
-        }, indent=2)
+        batch_json_example = _fill_schema(_batch_schema_template(batch_num == 1, batch_num == total_batches), {
+            "__MODULE_NUMBER__": first_module
+        }).replace("__MODULE_NUMBER_TEXT__", str(first_module))
         
         prompt_parts = [
             f"🔄 **BATCH {batch_num}/{total_batches} - HIGH-QUALITY COURSE GENERATION**",
             "",
-            f"Generating {settings['modules']} DETAILED modules for this batch using ONLY the provided content segment.",
-            f"Total course: {sum(modules_per_batch)} modules across {total_batches} batches.",
-            "",
-            "📋 **BATCH SPECIFICS:**",
-            f"• This batch covers Modules {sum(modules_per_batch[:batch_num-1]) + 1} to {sum(modules_per_batch[:batch_num])}",
-            f"• Use segment content comprehensively - balance topics across modules",
+            *source_lines,
             f"• Metadata (title, description, outcomes): Include ONLY if batch_num==1",
             f"• Flashcards & Bonus: Include ONLY if batch_num=={total_batches} - EXACTLY {flashcards_count} flashcards with full fields: mnemonic, importance, visual_cue, emoji-point related_concepts",
             "",
-            "🎯 **CONTINUITY & QUALITY:**",
-            "1. Base modules on THIS BATCH'S CONTENT SEGMENT - cover all key ideas emoji point-wise with subpoints (use 📍, 🔹, 📋)",
+            "🎯 **QUALITY:**",
+            source_rule,
             "2. **EMOJI POINT-WISE INTRODUCTION AND CONTENT ONLY** - no paragraphs, no hyphens, all in structured emoji points",
             "3. **BOLD IMPORTANT TERMS** - highlight key concepts using **bold** format",
-            "4. Connect to previous: {continuity_context}",
             "",
             "🚫 **SYMBOL-FREE FORMATTING:**",
             "- No hyphens (-), bullets (•), or emojis in content except for bullet points (use 📍, 🔹, 📋)",
@@ -612,9 +820,9 @@ class GeminiCourseGenerator:
             "📋 **USE THIS PARTIAL JSON STRUCTURE (focus on modules for this batch): **",
             batch_json_example,
             '\n'.join(quality_guidelines),
-            f"{content}",
+            content,
             "",
-            "Focus on quality content without decorative symbols! Generate VALID JSON ONLY with emoji point-wise notes and EXACTLY {flashcards_count} flashcards details.",
+            f"Focus on quality content without decorative symbols! Generate VALID JSON ONLY with emoji point-wise notes and EXACTLY {flashcards_count} flashcards details.",
             ""
         ]
         
@@ -626,205 +834,56 @@ class GeminiCourseGenerator:
             # Clean JSON response
             cleaned_text = self._clean_json_response(response_text)
             
-            # Parse JSON
-            course_data = json.loads(cleaned_text)
-            
-            # Clean unwanted symbols from the course data
-            course_data = self._clean_course_symbols(course_data)
+            # Parse JSON - orjson is ~2x faster than json on a 30 KB course payload
+            course_data = orjson.loads(cleaned_text)
             
-            # Validate and fix quiz structure
-            course_data = self._validate_and_fix_quiz_structure(course_data, settings)
+            # Clean unwanted symbols and fix quiz structure in one pass
+            course_data = self._clean_and_fix_course(course_data, settings)
             
             # Validate overall structure
             return self._validate_course_structure(course_data, settings)
             
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parsing error: {e}")
+        except orjson.JSONDecodeError as e:
+            logger.warning("⚠️ JSON parsing error, attempting repair: %s", e)
+            # Repair typical LLM defects (trailing commas, unquoted keys, truncated output) - no new Gemini call
+            try:
+                course_data = repair_json(cleaned_text, return_objects=True)
+                if isinstance(course_data, dict) and course_data:
+                    course_data = self._clean_and_fix_course(course_data, settings)
+                    course_data = self._validate_course_structure(course_data, settings)
+                    # Likely a reply cut off at the token cap, padded with placeholders - usable, not cacheable
+                    course_data['repaired'] = True
+                    return course_data
+            except Exception as repair_error:
+                logger.warning("⚠️ JSON repair failed: %s", repair_error)
+            
             # Advanced cleaning attempt
             advanced_cleaned = self._advanced_json_cleaning(response_text)
             try:
-                course_data = json.loads(advanced_cleaned)
-                course_data = self._clean_course_symbols(course_data)
-                course_data = self._validate_and_fix_quiz_structure(course_data, settings)
+                course_data = orjson.loads(advanced_cleaned)
+                course_data = self._clean_and_fix_course(course_data, settings)
                 return self._validate_course_structure(course_data, settings)
             except:
-                print(f"❌ Advanced cleaning failed, using fallback")
+                logger.warning("⚠️ Advanced cleaning failed, using fallback")
                 return self._create_fallback_course(settings)
     
-    def _validate_and_fix_quiz_structure(self, course_data, settings):
-        """Validate and fix quiz question structure"""
+    def _clean_and_fix_course(self, course_data, settings):
+        """Clean unwanted symbols and fix quiz structure in a single walk over the modules"""
         if 'course' not in course_data:
             return course_data
         
         course = course_data['course']
         questions_per_module = settings.get('questions_per_module', 3)
         
-        for module in course.get('modules', []):
-            # Fix module number if camelCase
-            if 'moduleNumber' in module:
-                module['module_number'] = module.pop('moduleNumber')
-            
-            if 'quiz' not in module:
-                module['quiz'] = {'questions': []}
-            
-            quiz = module['quiz']
-            if 'questions' not in quiz:
-                quiz['questions'] = []
-            
-            # Ensure we have the right number of questions
-            current_questions = quiz['questions']
-            
-            # Fix each question structure
-            for i, question in enumerate(current_questions):
-                # Ensure question has ID
-                if 'id' not in question:
-                    question['id'] = i + 1
-                
-                # Ensure options are properly formatted
-                if 'options' in question:
-                    # Fix option formatting
-                    fixed_options = []
-                    for j, option in enumerate(question['options']):
-                        if isinstance(option, str):
-                            # Ensure option has proper A), B), C), D) format
-                            option_letter = ['A', 'B', 'C', 'D'][j] if j < 4 else str(j+1)
-                            if not re.match(r'^[A-D]\)', option.strip()):
-                                fixed_options.append(f"{option_letter}) {option.strip()}")
-                            else:
-                                fixed_options.append(option.strip())
-                        else:
-                            option_letter = ['A', 'B', 'C', 'D'][j] if j < 4 else str(j+1)
-                            fixed_options.append(f"{option_letter}) {str(option)}")
-                    
-                    # Ensure we have exactly 4 options
-                    while len(fixed_options) < 4:
-                        option_letter = ['A', 'B', 'C', 'D'][len(fixed_options)]
-                        fixed_options.append(f"{option_letter}) Option not available")
-                    
-                    question['options'] = fixed_options[:4]  # Keep only first 4
-                
-                # Ensure correct_answer is valid
-                if 'correct_answer' not in question or question['correct_answer'] not in ['A', 'B', 'C', 'D']:
-                    question['correct_answer'] = 'A'  # Default to first option
-                
-                # Ensure explanation exists
-                if 'explanation' not in question or not question['explanation']:
-                    question['explanation'] = "Explanation not available"
-                
-                # Ensure difficulty exists
-                if 'difficulty' not in question:
-                    question['difficulty'] = 'medium'
-                
-                # Ensure knowledgeArea exists
-                if 'knowledgeArea' not in question:
-                    question['knowledgeArea'] = module.get('title', 'General Knowledge')
-                
-                # Ensure commonMistake exists
-                if 'commonMistake' not in question:
-                    question['commonMistake'] = 'No common mistake information available'
-                
-                # Ensure points exist
-                if 'points' not in question:
-                    question['points'] = 5
-            
-            # If we don't have enough questions, add placeholder questions
-            while len(current_questions) < questions_per_module:
-                new_question = {
-                    'id': len(current_questions) + 1,
-                    'question': f'Question about {module.get("title", "this module")}?',
-                    'options': [
-                        'A) First option',
-                        'B) Second option',
-                        'C) Third option',
-                        'D) Fourth option'
-                    ],
-                    'correct_answer': 'A',
-                    'explanation': 'This is a placeholder question. Real questions were not provided.',
-                    'difficulty': 'medium',
-                    'knowledgeArea': module.get('title', 'General Knowledge'),
-                    'commonMistake': 'No common mistake information available',
-                    'points': 5
-                }
-                current_questions.append(new_question)
-        
-        return course_data
-    
-    def _clean_course_symbols(self, course_data):
-        """Remove unwanted symbols from course content"""
-        if 'course' not in course_data:
-            return course_data
-        
-        course = course_data['course']
-        
         # Clean title and description
         for field in ['title', 'description', 'target_audience']:
             if field in course and course[field]:
                 course[field] = self._remove_symbols(course[field])
         
-        # Clean modules
+        # Clean each module, then fix its quiz (knowledgeArea defaults read the cleaned title)
         for module in course.get('modules', []):
-            # Clean module fields
-            for field in ['title', 'description']:
-                if field in module and module[field]:
-                    module[field] = self._remove_symbols(module[field])
-            
-            # Clean content
-            if 'content' in module:
-                content = module['content']
-                for field in ['introduction', 'summary']:
-                    if field in content and content[field]:
-                        content[field] = self._remove_symbols(content[field])
-                
-                # Clean sections
-                for section in content.get('sections', []):
-                    # Fix camelCase if present
-                    if 'heading' not in section and 'Heading' in section:
-                        section['heading'] = section.pop('Heading', '')
-                    
-                    for section_field in ['heading', 'content', 'real_world_application', 'common_mistakes']:
-                        if section_field in section and section[section_field]:
-                            section[section_field] = self._remove_symbols(section[section_field])
-                    
-                    # Clean notes hierarchy
-                    if 'notes_hierarchy' in section:
-                        hierarchy = section['notes_hierarchy']
-                        if 'main_topic' in hierarchy:
-                            hierarchy['main_topic'] = self._remove_symbols(hierarchy['main_topic'])
-                        
-                        for subtopic in hierarchy.get('subtopics', []):
-                            if 'subtopic' in subtopic:
-                                subtopic['subtopic'] = self._remove_symbols(subtopic['subtopic'])
-                            
-                            # Clean points and sub_points
-                            for i in range(len(subtopic.get('points', []))):
-                                subtopic['points'][i] = self._remove_symbols(subtopic['points'][i])
-                            for i in range(len(subtopic.get('sub_points', []))):
-                                subtopic['sub_points'][i] = self._remove_symbols(subtopic['sub_points'][i])
-                            for i in range(len(subtopic.get('important_concepts', []))):
-                                subtopic['important_concepts'][i] = self._remove_symbols(subtopic['important_concepts'][i])
-                        
-                        # Clean key takeaways
-                        for i in range(len(hierarchy.get('key_takeaways', []))):
-                            hierarchy['key_takeaways'][i] = self._remove_symbols(hierarchy['key_takeaways'][i])
-            
-            # Clean practical exercises
-            for exercise in module.get('practical_exercises', []):
-                for field in ['title', 'description', 'expected_outcome']:
-                    if field in exercise and exercise[field]:
-                        exercise[field] = self._remove_symbols(exercise[field])
-                for i in range(len(exercise.get('steps', []))):
-                    exercise['steps'][i] = self._remove_symbols(exercise['steps'][i])
-            
-            # Clean quiz questions (but preserve option formatting)
-            if 'quiz' in module and 'questions' in module['quiz']:
-                for question in module['quiz']['questions']:
-                    # Clean question text but preserve option formatting
-                    if 'question' in question:
-                        question['question'] = self._remove_symbols(question['question'])
-                    if 'explanation' in question:
-                        question['explanation'] = self._remove_symbols(question['explanation'])
-                    if 'commonMistake' in question:
-                        question['commonMistake'] = self._remove_symbols(question['commonMistake'])
+            self._clean_module_symbols(module)
+            self._fix_module_quiz(module, questions_per_module)
         
         # Clean flashcards
         for flashcard in course.get('flashcards', []):
@@ -833,61 +892,208 @@ class GeminiCourseGenerator:
                     flashcard[field] = self._remove_symbols(flashcard[field])
             
             # Clean related_concepts array
-            if 'related_concepts' in flashcard:
-                for i in range(len(flashcard['related_concepts'])):
-                    flashcard['related_concepts'][i] = self._remove_symbols(flashcard['related_concepts'][i])
+            self._clean_list_field(flashcard, 'related_concepts')
         
         return course_data
     
+    def _fix_module_quiz(self, module, questions_per_module):
+        """Validate and fix one module's quiz question structure"""
+        # Fix module number if camelCase
+        if 'moduleNumber' in module:
+            module['module_number'] = module.pop('moduleNumber')
+        
+        if 'quiz' not in module:
+            module['quiz'] = {'questions': []}
+        
+        quiz = module['quiz']
+        if 'questions' not in quiz:
+            quiz['questions'] = []
+        
+        # Ensure we have the right number of questions
+        current_questions = quiz['questions']
+        
+        # Fix each question structure
+        for i, question in enumerate(current_questions):
+            # Ensure question has ID
+            if 'id' not in question:
+                question['id'] = i + 1
+            
+            # Ensure options are properly formatted
+            if 'options' in question:
+                # Fix option formatting - only the first 4 are kept, so only those are normalized
+                fixed_options = []
+                for option_letter, option in zip(_OPTION_LETTERS, question['options']):
+                    if isinstance(option, str):
+                        # Ensure option has proper A), B), C), D) format
+                        option = option.strip()
+                        fixed_options.append(option if option.startswith(_OPTION_PREFIXES) else f"{option_letter}) {option}")
+                    else:
+                        fixed_options.append(f"{option_letter}) {option}")
+                
+                # Ensure we have exactly 4 options
+                fixed_options.extend(f"{option_letter}) Option not available" for option_letter in _OPTION_LETTERS[len(fixed_options):])
+                
+                question['options'] = fixed_options
+            
+            # Ensure correct_answer is valid
+            if 'correct_answer' not in question or question['correct_answer'] not in ['A', 'B', 'C', 'D']:
+                question['correct_answer'] = 'A'  # Default to first option
+            
+            # Ensure explanation exists
+            if 'explanation' not in question or not question['explanation']:
+                question['explanation'] = "Explanation not available"
+            
+            # Ensure difficulty exists
+            if 'difficulty' not in question:
+                question['difficulty'] = 'medium'
+            
+            # Ensure knowledgeArea exists
+            if 'knowledgeArea' not in question:
+                question['knowledgeArea'] = module.get('title', 'General Knowledge')
+            
+            # Ensure commonMistake exists
+            if 'commonMistake' not in question:
+                question['commonMistake'] = 'No common mistake information available'
+            
+            # Ensure points exist
+            if 'points' not in question:
+                question['points'] = 5
+        
+        # If we don't have enough questions, add placeholder questions
+        while len(current_questions) < questions_per_module:
+            new_question = {
+                'id': len(current_questions) + 1,
+                'question': f'Question about {module.get("title", "this module")}?',
+                'options': [
+                    'A) First option',
+                    'B) Second option',
+                    'C) Third option',
+                    'D) Fourth option'
+                ],
+                'correct_answer': 'A',
+                'explanation': 'This is a placeholder question. Real questions were not provided.',
+                'difficulty': 'medium',
+                'knowledgeArea': module.get('title', 'General Knowledge'),
+                'commonMistake': 'No common mistake information available',
+                'points': 5
+            }
+            current_questions.append(new_question)
+    
+    def _clean_module_symbols(self, module):
+        """Remove unwanted symbols from one module's content (preserves option formatting)"""
+        # Clean module fields
+        for field in ['title', 'description']:
+            if field in module and module[field]:
+                module[field] = self._remove_symbols(module[field])
+        
+        # Clean content
+        if 'content' in module:
+            content = module['content']
+            for field in ['introduction', 'summary']:
+                if field in content and content[field]:
+                    content[field] = self._remove_symbols(content[field])
+            
+            # Clean sections
+            for section in content.get('sections', []):
+                # Fix camelCase if present
+                if 'heading' not in section and 'Heading' in section:
+                    section['heading'] = section.pop('Heading', '')
+                
+                for section_field in ['heading', 'content', 'real_world_application', 'common_mistakes']:
+                    if section_field in section and section[section_field]:
+                        section[section_field] = self._remove_symbols(section[section_field])
+                
+                # Clean notes hierarchy
+                if 'notes_hierarchy' in section:
+                    hierarchy = section['notes_hierarchy']
+                    if 'main_topic' in hierarchy:
+                        hierarchy['main_topic'] = self._remove_symbols(hierarchy['main_topic'])
+                    
+                    for subtopic in hierarchy.get('subtopics', []):
+                        if 'subtopic' in subtopic:
+                            subtopic['subtopic'] = self._remove_symbols(subtopic['subtopic'])
+                        
+                        # Clean points and sub_points
+                        self._clean_list_field(subtopic, 'points')
+                        self._clean_list_field(subtopic, 'sub_points')
+                        self._clean_list_field(subtopic, 'important_concepts')
+                    
+                    # Clean key takeaways
+                    self._clean_list_field(hierarchy, 'key_takeaways')
+        
+        # Clean practical exercises
+        for exercise in module.get('practical_exercises', []):
+            for field in ['title', 'description', 'expected_outcome']:
+                if field in exercise and exercise[field]:
+                    exercise[field] = self._remove_symbols(exercise[field])
+            self._clean_list_field(exercise, 'steps')
+        
+        # Clean quiz questions (but preserve option formatting)
+        if 'quiz' in module and 'questions' in module['quiz']:
+            for question in module['quiz']['questions']:
+                # Clean question text but preserve option formatting
+                if 'question' in question:
+                    question['question'] = self._remove_symbols(question['question'])
+                if 'explanation' in question:
+                    question['explanation'] = self._remove_symbols(question['explanation'])
+                if 'commonMistake' in question:
+                    question['commonMistake'] = self._remove_symbols(question['commonMistake'])
+    
+    def _clean_list_field(self, obj, field):
+        """Replace obj[field] (a list of strings) with its cleaned copy, if present"""
+        if field in obj:
+            obj[field] = [self._remove_symbols(item) for item in obj[field]]
+    
     def _remove_symbols(self, text):
         """Remove unwanted symbols from text but preserve option formatting"""
         if not isinstance(text, str):
             return text
         
         # Remove specific unwanted symbols but keep essential punctuation and option letters
-        symbols_to_remove = ['*', '•', '⭐', '🎯', '🚀', '📚', '🔄', '💡', '🎨', '📋']
-        
-        cleaned = text
-        for symbol in symbols_to_remove:
-            cleaned = cleaned.replace(symbol, '')
+        cleaned = text.translate(_SYMBOL_TABLE)
         
         # Clean up extra spaces but preserve option formatting
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+        cleaned = _WHITESPACE_RE.sub(' ', cleaned).strip()
         
         return cleaned
     
     def _clean_json_response(self, text):
         """Enhanced JSON response cleaning"""
         # Remove markdown code blocks
-        text = re.sub(r'```json\s*', '', text)
-        text = re.sub(r'```\s*', '', text)
+        text = _CODE_FENCE_RE.sub('', text)
         
-        # Remove any text before first { and after last }
+        # Remove any text before first { and after last } (this also drops leading/trailing chatter)
         start = text.find('{')
         end = text.rfind('}') + 1
         
         if start != -1 and end != 0:
             text = text[start:end]
         
-        # Remove common AI response artifacts
-        text = re.sub(r'^(Sure|Okay|Here).*?{', '{', text, flags=re.IGNORECASE | re.DOTALL)
-        text = re.sub(r'}\s*[^{]*$', '}', text)
-        
         return text.strip()
     
     def _advanced_json_cleaning(self, text):
-        """Advanced JSON cleaning for problematic responses"""
-        json_pattern = r'\{.*\}'
-        matches = re.findall(json_pattern, text, re.DOTALL)
-        
-        if matches:
-            return max(matches, key=len)
+        """Advanced JSON cleaning for problematic responses - largest balanced {...} span"""
+        best_start, best_end = 0, 0
+        depth, start = 0, -1
+        # Visit only the braces; the regex engine skips everything in between
+        for match in _BRACE_RE.finditer(text):
+            if match.group() == '{':
+                if depth == 0:
+                    start = match.start()
+                depth += 1
+            elif depth > 0:
+                depth -= 1
+                if depth == 0 and match.end() - start > best_end - best_start:
+                    best_start, best_end = start, match.end()
+        
+        if best_end:
+            return text[best_start:best_end]
         
         return self._construct_json_from_text(text)
     
     def _construct_json_from_text(self, text):
         """Construct JSON from text analysis as last resort"""
-        print("🛠️  Constructing JSON from text analysis...")
+        logger.debug("🛠️  Constructing JSON from text analysis...")
         return self._create_fallback_course({
             "difficulty": "intermediate",
             "learning_pace": "medium", 
@@ -973,25 +1179,19 @@ class GeminiCourseGenerator:
         flashcards_count = settings.get('flashcards', 15)
         
         for i in range(settings.get('modules', 4)):
-            # Create quiz questions for each module
-            quiz_questions = []
-            for q in range(questions_per_module):
-                quiz_questions.append({
+            # Create quiz questions for each module (same text for every question in the module)
+            question_text = f'What is the key concept from Module {i+1}?'
+            knowledge_area = f'Module {i+1} Concepts'
+            quiz_questions = [
+                {
                     'id': q + 1,
-                    'question': f'What is the key concept from Module {i+1}?',
-                    'options': [
-                        'A) First important concept',
-                        'B) Second important concept',
-                        'C) Third important concept', 
-                        'D) Fourth important concept'
-                    ],
-                    'correct_answer': 'A',
-                    'explanation': '📍 This is the most fundamental concept for this module. 🔹 Reason 1. 📋 Reason 2.',
-                    'difficulty': 'medium',
-                    'knowledgeArea': f'Module {i+1} Concepts',
-                    'commonMistake': '📍 Confusing this with other similar concepts. 🔹 How to avoid: Focus on key differences.',
-                    'points': 5
-                })
+                    'question': question_text,
+                    'options': list(_FALLBACK_OPTIONS),
+                    **_FALLBACK_QUESTION,
+                    'knowledgeArea': knowledge_area
+                }
+                for q in range(questions_per_module)
+            ]
             
             modules.append({
                 'module_number': i + 1,
@@ -1019,21 +1219,22 @@ class GeminiCourseGenerator:
             })
         
         # Generate exactly flashcards_count flashcards
-        flashcards = []
-        for i in range(flashcards_count):
-            flashcards.append({
+        flashcards = [
+            {
                 "id": i + 1,
                 "front": f"Key Term {i + 1}",
                 "back": f"📍 Definition of key term {i + 1}. 🔹 Detailed explanation.",
                 "mnemonic": f"Memory aid for term {i + 1}: Use acronym or story",
-                "category": "Fundamentals",
-                "importance": "high - crucial for understanding core concepts",
+                **_FALLBACK_FLASHCARD,
                 "visual_cue": f"Visual memory aid for term {i + 1}: imagine a related image",
-                "related_concepts": ["📍 Related concept 1 with brief point", "🔹 Related concept 2"],
-                "difficulty": "medium"
-            })
+                "related_concepts": ["📍 Related concept 1 with brief point", "🔹 Related concept 2"]
+            }
+            for i in range(flashcards_count)
+        ]
         
+        # Flagged so callers never cache or reuse the placeholder as a real course
         return {
+            "fallback": True,
             "course": {
                 "title": "Comprehensive Learning Course",
                 "description": "A well-structured course covering essential concepts with practical applications",
@@ -0,0 +1,46 @@
+import os
+import sys
+import subprocess
+import multiprocessing
+
+# Make `app`, `tasks`, `database.*` importable whether started as app:app or api.app:app
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Handlers mostly wait on Mongo/Gemini/OCR I/O - green threads keep a worker serving
+# other clients during those waits. Set GUNICORN_WORKER_CLASS=gthread to opt out.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))  # Only used by gthread workers
+
+# /api/generate-course still generates synchronously and can take minutes
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 600))
+
+# Never build Mongo/Gemini/OCR clients in the arbiter - pymongo is not fork-safe
+preload_app = False
+
+
+def on_starting(server):
+    """Build Mongo indexes once before the workers start, then tell workers to skip the DDL"""
+    # Workers split GEMINI_RPM between them (see GeminiCourseGenerator)
+    os.environ['BRAINFORGE_PROCESSES'] = str(server.cfg.workers)
+    if os.getenv('BRAINFORGE_MOCK') != '1':
+        # Separate process: importing pymongo (and ssl) in the unpatched arbiter would break
+        # gevent's later ssl patching in every forked worker
+        try:
+            subprocess.run(
+                [sys.executable, os.path.join('database', 'mongodb.py'), '--init-indexes'],
+                cwd=pythonpath, timeout=120, check=True
+            )
+        except (subprocess.SubprocessError, OSError) as e:
+            server.log.warning("Mongo index bootstrap failed, run `python database/mongodb.py --init-indexes`: %s", e)
+    os.environ['BRAINFORGE_BOOTSTRAP_INDEXES'] = '0'
+
+
+def post_fork(server, worker):
+    """Create per-worker components right after fork so each gets its own connection pool"""
+    flask_app = worker.app.wsgi()
+    sys.modules[flask_app.import_name].init_components()
+    server.log.info("BrainForge components initialized in worker %s", worker.pid)
@@ -1,68 +1,149 @@
 import os
 import sys
-import json
-from flask import Flask
+import io
+import base64
+import logging
+import orjson
 from flask_cors import CORS
-from dotenv import load_dotenv
 
-# Load local .env
-load_dotenv()
+# Load local .env - Vercel injects env vars and ships no .env, so skip the file search there
+if os.getenv('VERCEL') != '1':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# Index DDL is a deploy step (python database/mongodb.py --init-indexes), not a cold-start one
+os.environ.setdefault('BRAINFORGE_BOOTSTRAP_INDEXES', '0')
 
 # Add /api path to Python path for relative imports
 sys.path.insert(0, os.path.dirname(__file__))
 
-# Import tera main app (with all routes, instances: ocr_engine, db_manager, ai_processor)
-from app import app  # This imports your full app.py (Flask instance + globals)
+# Import tera main app (with all routes, lazy get_ocr/get_db/get_ai accessors)
+from app import app, UPLOAD_FOLDER, init_components  # This imports your full app.py (Flask instance + globals)
 
 # Vercel env config (overrides local)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-fallback-secret')
-app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 62914560))
-app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+_max_content_length = os.getenv('MAX_CONTENT_LENGTH')  # Unset or empty keeps the 60 MB default
+app.config['MAX_CONTENT_LENGTH'] = int(_max_content_length) if _max_content_length else 62914560
+# Uploads go to app.py's temp-dir UPLOAD_FOLDER (writable on Vercel, where only /tmp is) - it always exists
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # CORS from env (extend tera app.py ka)
-cors_origins = os.getenv('CORS_ORIGINS', 'http://localhost:3000,https://brain-yourusername.vercel.app').split(',')
+# Split and strip once at import - "a, b" in the env must still match origin "b"
+cors_origins = tuple(
+    origin.strip()
+    for origin in os.getenv('CORS_ORIGINS', 'http://localhost:3000,https://brain-yourusername.vercel.app').split(',')
+    if origin.strip()
+)
 CORS(app, origins=cors_origins)
 
-# Setup globals per request (serverless – but tera app.py me already init, so minimal)
+logger = logging.getLogger(__name__)
+_globals_ready = False
+
+# Setup globals once per container - load_dotenv() already put .env values in os.environ,
+# so there is nothing to copy; just report missing config (gemini_processor.py reads the key itself)
 def setup_globals():
-    os.environ['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
-    os.environ['MONGODB_URI'] = os.getenv('MONGODB_URI')
-    # No need for model init – tera gemini_processor.py already handles in class
+    global _globals_ready
+    if _globals_ready:
+        return
+    for name in ('GEMINI_API_KEY', 'MONGODB_URI'):
+        if not os.environ.get(name):
+            logger.warning("⚠️ %s is not set", name)
+    _globals_ready = True
+
+# One-time work runs at import, in the platform's init phase rather than the first billed request
+setup_globals()
+# Compile Werkzeug's URL matcher now instead of on the first request
+app.url_map.bind('localhost').match('/api/health')
+# The job queue's threads do not run once a response is sent here - background jobs need gunicorn
+# Build OCR, Mongo client, Gemini model and job queue now (same as gunicorn's post_fork) - a failure
+# here only logs; the lazy get_* accessors retry on the first request that needs the component
+try:
+    init_components()
+except Exception as e:
+    logger.warning("⚠️ Component warm-up failed, falling back to lazy init: %s", e)
+
+_BODY_METHODS = frozenset(('POST', 'PUT', 'PATCH', 'DELETE'))
+
+def _build_environ(request):
+    """Minimal WSGI environ for a platform request - what EnvironBuilder would produce, without the builder"""
+    # Only touch request.body for methods that carry one - some runtimes drain the stream on access
+    body = (request.body or b'') if request.method in _BODY_METHODS else b''
+    if isinstance(body, str):
+        body = body.encode()
+    query_string = request.query_string or ''
+    if isinstance(query_string, bytes):
+        query_string = query_string.decode('latin-1')
+    
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        # WSGI carries paths as latin-1 decoded bytes
+        'PATH_INFO': request.path.encode().decode('latin-1'),
+        'QUERY_STRING': query_string,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '443',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'https',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for key, value in request.headers:
+        name = key.upper().replace('-', '_')
+        if name in ('HOST', 'CONTENT_LENGTH'):
+            continue
+        environ[name if name == 'CONTENT_TYPE' else f'HTTP_{name}'] = value
+    return environ
+
+def _call_app(environ):
+    """Run the Flask WSGI app directly and wrap the result as a Response (no test request context)"""
+    captured = {}
+    
+    def start_response(status, headers, exc_info=None):
+        captured['status'] = status
+        captured['headers'] = headers
+    
+    app_iter = app.wsgi_app(environ, start_response)
+    try:
+        data = b''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+    return app.response_class(data, status=captured['status'], headers=captured['headers'])
+
+# Fixed-shape 500 body - only the message varies, and orjson.dumps(str) handles its escaping
+_ERROR_PREFIX = b'{"error":'
+_ERROR_SUFFIX = b',"message":"Internal server error"}'
+_ERROR_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
 
 # Vercel Handler (wraps your app routes for serverless – /api/... paths pass through)
 def handler(request):
-    setup_globals()
-    
-    with app.test_request_context(
-        path=request.path,
-        method=request.method,
-        headers=dict([(k, v) for k, v in request.headers if k.lower() != 'host']),
-        body=request.body or None,
-        query_string=request.query_string
-    ):
-        try:
-            # Dispatch to your routes (e.g., /api/health, /api/upload from app.py)
-            response = app.full_dispatch_request()
-            
-            # Vercel format
-            body = response.get_data(as_text=True) if 'text/html' in response.mimetype else response.get_json()
+    try:
+        # Dispatch to your routes (e.g., /api/health, /api/upload from app.py)
+        response = _call_app(_build_environ(request))
+        
+        # Vercel format - JSON bodies are already serialized, pass them through instead of parse + re-dump
+        # Flask-Compress br/gzip-encodes JSON over 1 KB - those bytes are not text, send them base64 below
+        if 'Content-Encoding' not in response.headers and (response.is_json or response.mimetype.startswith('text/')):
             return {
                 'statusCode': response.status_code,
-                'body': json.dumps(body) if isinstance(body, dict) else body,
+                'body': response.get_data(as_text=True),
                 'headers': dict(response.headers)
             }
-        except Exception as e:
-            return {
-                'statusCode': 500,
-                'body': json.dumps({'error': str(e), 'message': 'Internal server error'}),
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
-            }
-
-# Local run (same as app.py, but for testing index.py)
-if __name__ == '__main__':
-    app.run(
-        debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true',
-        host='0.0.0.0',
-        port=int(os.getenv('PORT', 5000))
-    )
\ No newline at end of file
+        # Binary or compressed bodies go out base64 - a UTF-8 decode would mangle them
+        return {
+            'statusCode': response.status_code,
+            'body': base64.b64encode(response.get_data()).decode('ascii'),
+            'headers': dict(response.headers),
+            'isBase64Encoded': True
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': (_ERROR_PREFIX + orjson.dumps(str(e)) + _ERROR_SUFFIX).decode(),
+            'headers': dict(_ERROR_HEADERS)
+        }
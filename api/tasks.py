@@ -0,0 +1,102 @@
+import os
+import uuid
+import threading
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_FINISHED_STATUSES = ('completed', 'failed')
+_ACTIVE_STATUSES = ('queued', 'processing')
+
+
+class JobQueue:
+    """Run long upload/generation pipelines off the request thread and track their status
+
+    Needs a long-lived worker process (gunicorn). The Vercel entry (index.py) freezes the
+    instance once the 202 is returned, so jobs queued there never finish.
+    """
+
+    def __init__(self, db_manager=None, max_workers=None):
+        self.db_manager = db_manager
+        self.max_workers = max_workers or int(os.getenv('PIPELINE_WORKERS', 2))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='brainforge-job')
+        self._jobs = {}  # Queued/processing jobs only
+        # Finished jobs (with their full result) stay here briefly, then only in MongoDB
+        self._finished = TTLCache(
+            maxsize=int(os.getenv('FINISHED_JOBS_CACHE', 256)),
+            ttl=int(os.getenv('FINISHED_JOBS_TTL', 600))
+        )
+        self._lock = threading.Lock()
+        # A job another process has not touched for this long lost its worker (timeout kill, recycle, redeploy)
+        self.stale_after = int(os.getenv('JOB_STALE_SECONDS', os.getenv('GUNICORN_TIMEOUT', 600)))
+        logger.info("✅ Job queue ready with %s workers", self.max_workers)
+
+    def submit(self, func, *args, **metadata):
+        """Queue func(job_id, *args) and return the new job_id immediately"""
+        job_id = uuid.uuid4().hex
+        now = datetime.now()
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "stage": "queued",
+            "created_at": now,
+            "updated_at": now,
+            **metadata
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        self._persist(job)
+
+        self._executor.submit(self._run, job_id, func, *args)
+        return job_id
+
+    def update(self, job_id, **fields):
+        """Update job status fields (stage, status, result, error...)"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None) or self._finished.pop(job_id, None) or {"job_id": job_id}
+            job.update(fields)
+            job['updated_at'] = datetime.now()
+            if job.get('status') in _FINISHED_STATUSES:
+                self._finished[job_id] = job
+            else:
+                self._jobs[job_id] = job
+            snapshot = dict(job)
+        self._persist(snapshot)
+
+    def get(self, job_id):
+        """Get job status - local first, then database (job may run on another worker)"""
+        with self._lock:
+            job = self._jobs.get(job_id) or self._finished.get(job_id)
+            if job:
+                return dict(job)
+        if self.db_manager:
+            job = self.db_manager.get_job(job_id)
+            if job and job.get('status') in _ACTIVE_STATUSES and self._is_stale(job):
+                job.update(status="failed", stage="error", http_status=500,
+                           error="Job was interrupted by a server restart, please retry",
+                           updated_at=datetime.now())
+                self._persist(job)
+            return job
+        return None
+    
+    def _is_stale(self, job):
+        updated_at = job.get('updated_at')
+        return isinstance(updated_at, datetime) and (datetime.now() - updated_at).total_seconds() > self.stale_after
+
+    def _run(self, job_id, func, *args):
+        self.update(job_id, status="processing", stage="started")
+        try:
+            func(job_id, *args)
+        except Exception as e:
+            logger.exception("❌ Job %s crashed: %s", job_id, e)
+            self.update(job_id, status="failed", stage="error", error=f"Server error: {str(e)}", http_status=500)
+
+    def _persist(self, job):
+        if self.db_manager:
+            self.db_manager.save_job(job)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,8 @@
+import os
+
+# Patch sockets/threads before pymongo, requests or Flask are imported
+if os.getenv('GUNICORN_WORKER_CLASS', 'gevent') == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import app  # noqa: E402
@@ -97,7 +97,12 @@ class ApiService {
       }
 
       const result = await response.json();
-      console.log('✅ Upload successful:', result);
+      console.log('✅ Upload accepted:', result);
+
+      // Course generation runs as a background job - poll until it finishes
+      if (result.job_id) {
+        return await this.waitForJob(result.job_id);
+      }
       return result;
 
     } catch (error) {
@@ -106,6 +111,31 @@ class ApiService {
     }
   }
 
+  // ✅ BACKGROUND JOB POLLING
+  async getJobStatus(jobId) {
+    return this.request(`/jobs/${jobId}`);
+  }
+
+  async waitForJob(jobId, intervalMs = 3000, timeoutMs = 15 * 60 * 1000) {
+    const startedAt = Date.now();
+
+    while (Date.now() - startedAt < timeoutMs) {
+      const { job } = await this.getJobStatus(jobId);
+      console.log(`⏳ Job ${jobId}: ${job.status} (${job.stage})`);
+
+      if (job.status === 'completed') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Course generation failed');
+      }
+
+      await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+
+    throw new Error('Course generation timed out. Please check your dashboard later.');
+  }
+
   // ✅ QUIZ & FLASHCARDS DATA
   async getQuizData(courseId, moduleNumber = null) {
     try {